@@ -56,7 +56,7 @@ bluetooth = Bluetooth(ID, RPIS_MACS, ADJACENCY, verbose=True)
 balancer = Balancer()
 
 # Stand-up
-standup = Async(bluetooth, [balancer.balancing], standup, '?', delay=0)
+standup = Async(bluetooth, [balancer.balancing], standup, '?', delay=0, on_change=True)
 
 
 if __name__ == "__main__":
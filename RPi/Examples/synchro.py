@@ -20,7 +20,7 @@ sys.path.append(src_path)
 import oled
 from balboa import Balboa
 from bluetooth import Bluetooth
-from synchronous import Sync
+from synchronous import SyncGroup, SyncMember
 from utils import RPIS_MACS, ADJACENCY, check_args, signal_handler
 
 
@@ -59,14 +59,15 @@ phase = time.time() % (1 / init_freq)
 
 # Communication
 rocky = Balboa()
-bluetooth = Bluetooth(ID, RPIS_MACS, ADJACENCY, verbose=False, processes=2)
+bluetooth = Bluetooth(ID, RPIS_MACS, ADJACENCY, verbose=False)
 
 # Iterative function: next state is the average with its neighbors state
 compute_average = lambda buf: [float(np.mean([buf[n][1] for n in bluetooth.neighbors_index + [bluetooth.ID]]))]
 
-# Synchronized communication instances for each process
-phase_consensus = Sync(bluetooth, [phase], compute_average, 'f', process_id=0, delay=0.5)
-freq_consensus  = Sync(bluetooth, [init_freq], compute_average, 'f', process_id=1, delay=0.5)
+# Both consensus advance in the same synchronized rounds (one message for both states)
+phase_consensus = SyncMember([phase], compute_average, 'f')
+freq_consensus  = SyncMember([init_freq], compute_average, 'f')
+consensus = SyncGroup(bluetooth, [phase_consensus, freq_consensus], delay=0.5)
 
 
 if __name__ == "__main__":
@@ -77,10 +78,8 @@ if __name__ == "__main__":
     rocky.leds(0, 0, 0)
 
     # Run the synchronized communication using the iterative problem: compute_average for both frequency and average
-    consensus_thread = threading.Thread(target=phase_consensus.run, daemon=True)
+    consensus_thread = threading.Thread(target=consensus.run, daemon=True)
     consensus_thread.start()
-    synchro_thread = threading.Thread(target=freq_consensus.run, daemon=True)
-    synchro_thread.start()
     blink_thread = threading.Thread(target=blink, args=(phase_consensus, freq_consensus), daemon=True)
     blink_thread.start()
 
@@ -16,7 +16,7 @@ sys.path.append(src_path)
 
 from utils import RPIS_MACS, ADJACENCY, check_args, signal_handler
 from bluetooth import Bluetooth
-from flooding import Flooding
+from flooding import Flooding, reached
 from balboa import Balboa
 import oled
 
@@ -62,7 +62,7 @@ if __name__ == "__main__":
         # If current message is different than the one from previous iteration
         if flooding.last_message != last_seen_message:
             last_seen_message = flooding.last_message
-            oled.write("ACK:"*(len(last_seen_message.viewers)==len(ADJACENCY)) + last_seen_message.data.decode('utf-8'))
+            oled.write("ACK:"*(reached(last_seen_message.viewers)==len(ADJACENCY)) + last_seen_message.data.decode('utf-8'))
             ready_start_time = time.time()  # Reset LED timer on reception
 
         # If the elapsed time since last message is higher than 3 seconds, we shut down all leds
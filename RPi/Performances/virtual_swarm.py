@@ -0,0 +1,149 @@
+"""
+* Master's Thesis *
+Implementation of a robotic swarm platform
+based on the Balboa self-balancing robot
+© 2025 Romain Englebert
+"""
+
+
+import os, sys, time, threading
+from functools import partial
+
+# For being able to import files from ./../src/ and run it from anywhere in the system (useful for run.sh)
+script_dir = os.path.dirname(os.path.abspath(__file__))
+src_path = os.path.abspath(os.path.join(script_dir, "../src"))
+sys.path.append(src_path)
+
+from launcher import launch, ring, line, complete, random_graph
+from synchronous import Sync
+from flooding import Flooding
+
+
+"""
+Benchmark of a virtual swarm running on one computer (no RPi needed)
+Each node is a Bluetooth instance over AF_UNIX or TCP localhost sockets (see launcher.py).
+
+Usage: python virtual_swarm.py <n> <graph> <duration> <mode> <transport>
+    n: number of nodes
+    graph: ring, line, complete or random
+    duration: duration of the consensus benchmark in seconds
+    mode: threads or processes
+    transport: unix or tcp
+"""
+
+
+def consensus(bluetooth, duration):
+    """
+    Run an average consensus for duration seconds and return the number of iterations done, the final state and
+    the number of rounds per second over the last rounds
+    """
+
+    average = lambda buf: [sum(buf[n][1] for n in bluetooth.neighbors_index + [bluetooth.ID]) / (len(bluetooth.neighbors_index) + 1)]
+    sync = Sync(bluetooth, [float(bluetooth.ID)], average, 'f', verbose=False)
+    threading.Thread(target=sync.run, daemon=True).start()
+    time.sleep(duration)
+    return sync.iteration, sync.state[0], sync.rounds_per_second()
+
+
+def flood(bluetooth, relay):
+    """
+    Node 0 broadcasts one message with the relay strategy, return the time at which each node received it (None if
+    it did not) and its relay stats
+    """
+
+    flooding = Flooding(bluetooth, None, verbose=False, relay=relay)
+    flooding.listen()
+    time.sleep(1)
+
+    if bluetooth.ID == 0:
+        t = time.time()
+        flooding.broadcast("benchmark")
+        time.sleep(1)
+        return t, flooding.relay_stats()
+
+    start = time.time()
+    while flooding.last_message is None:
+        if time.time() - start > 10:
+            return None, flooding.relay_stats()
+        time.sleep(1e-3)
+    t = time.time()
+    time.sleep(1)  # Relays of the other nodes
+    return t, flooding.relay_stats()
+
+
+def push(bluetooth, size=100000):
+    """
+    Node 0 broadcasts size bytes (fragmented), return the time at which each node reassembled them (None if it did
+    not), and for node 0 the time at which its callback reported that every node did
+    """
+
+    payload = bytes(range(256)) * (size // 256)  # Same payload on every node
+    flooding = Flooding(bluetooth, None, verbose=False)
+    flooding.listen()
+    time.sleep(1)
+
+    start = time.time()
+    if bluetooth.ID == 0:
+        done = []
+        flooding.broadcast(payload, lambda message: done.append(time.time()))
+        while not done and time.time() - start < 30:
+            time.sleep(1e-3)
+        time.sleep(1)  # Requests of the other nodes
+        return start, done[0] if done else None
+
+    while not (flooding.last_message is not None and flooding.last_message.data == payload):
+        if time.time() - start > 30:
+            return None, None
+        time.sleep(1e-3)
+    t = time.time()
+    time.sleep(1)  # Requests of the other nodes
+    return t, None
+
+
+if __name__ == "__main__":
+
+    if len(sys.argv) != 6:
+        print("Usage: python virtual_swarm.py <n> <graph> <duration> <mode> <transport>")
+        sys.exit(1)
+
+    n = int(sys.argv[1])
+    graphs = {'ring': ring, 'line': line, 'complete': complete, 'random': lambda n: random_graph(n, 0.05, seed=0)}
+    adjacency = graphs[sys.argv[2]](n)
+    duration = float(sys.argv[3])
+    mode, transport = sys.argv[4], sys.argv[5]
+
+    results = launch(adjacency, partial(consensus, duration=duration), mode=mode, transport=transport)
+    iterations = [r[0] for r in results]
+    print()
+    print(f"Consensus on {n} nodes ({sys.argv[2]}) during {duration}s:")
+    print(f"    rounds/sec: min {min(iterations) / duration:.2f}, max {max(iterations) / duration:.2f}")
+    print(f"    rounds/sec (last rounds): min {min(r[2] for r in results):.2f}, max {max(r[2] for r in results):.2f}")
+    print(f"    states: min {min(r[1] for r in results):.4f}, max {max(r[1] for r in results):.4f}")
+
+    # Every node has to be reached with 'flood' and 'mpr', 'counter' and 'gossip' may miss some (probabilistic)
+    for k, (relay, guaranteed) in enumerate([('flood', True), ('mpr', True), ('counter', False), ('gossip', False)]):
+        results = launch(adjacency, partial(flood, relay=relay), mode=mode, transport=transport,
+                         base_port=47000 + 1000 * (k + 1) + n)
+        times = [r[0] for r in results]
+        received = [t for t in times[1:] if t is not None]
+        transmissions = sum(r[1]['transmissions'] for r in results)
+        print()
+        print(f"Flooding on {n} nodes ({sys.argv[2]}), relay '{relay}':")
+        print(f"    reached: {len(received)}/{n - 1}")
+        if received:
+            latencies = [t - times[0] for t in received]
+            print(f"    latency: mean {sum(latencies) / len(latencies):.4f}s, max {max(latencies):.4f}s")
+        print(f"    transmissions per delivery: {transmissions / max(len(received), 1):.2f}")
+        if guaranteed:
+            assert len(received) == n - 1, f"relay '{relay}' did not reach every node"
+
+    results = launch(adjacency, push, mode=mode, transport=transport, base_port=47000 + 5000 + n)
+    start, completed = results[0]
+    received = [r[0] for r in results[1:] if r[0] is not None]
+    print()
+    print(f"Fragmented broadcast of 100 KB on {n} nodes ({sys.argv[2]}):")
+    print(f"    reached: {len(received)}/{n - 1}")
+    if received:
+        print(f"    latency: mean {sum(received) / len(received) - start:.4f}s, max {max(received) - start:.4f}s")
+    assert len(received) == n - 1 and completed is not None, "fragmented broadcast did not complete"
+    print(f"    completion known by node 0: {completed - start:.4f}s")
@@ -7,12 +7,13 @@ based on the Balboa self-balancing robot
 
 
 import time
-import struct
+from schema import MessageSchema, ASYNC
 
 
 class Async:
 
-    def __init__(self, bt, init_state, next_msg, msg_struct, delay=0, process_id=0, verbose=True):
+    def __init__(self, bt, init_state, next_msg, msg_struct, delay=0, process_id=0, verbose=True, profile=False,
+                 on_change=False, tolerance=0, keepalive=1.0, views=False, expiry=None):
         """
         Args:
             bt:                     instance of Bluetooth used for this process.
@@ -21,6 +22,17 @@ class Async:
             msg_struct:               str corresponding to the state type base on struct types (size:len(init_state))
             delay:                  optional delay between each message
             process_id:             optional int corresponding to the process id
+            profile:                bool for recording the time spent in each phase of each round in self.profiler
+                                    (phases 'send', 'wait', 'compute', 'delay', see profiler.py)
+            on_change:              bool for sending the message only when it changed (event-triggered mode)
+            tolerance:              change of a numeric field below which it is considered unchanged in on_change mode,
+                                    one value for all fields or a list (size:len(init_state))
+            keepalive:              in on_change mode, the message is sent again after keepalive seconds without change
+            views:                  bool for calling next_msg(buffer, views), views[i] being (age (s), sequence number)
+                                    of the message of RPi i, None if no message has been received (see self.views())
+            expiry:                 optional age (s) beyond which a neighbor message is discarded: its row of the
+                                    buffer is reset to -1.0 and its view to None, it must exceed the keepalive
+                                    of neighbors in on_change mode (an unchanged neighbor only sends every keepalive)
 
         Notes:
             process_id has to be set if several processes need bluetooth.
@@ -56,8 +68,32 @@ class Async:
         self.PROCESS = process_id
         self.DELAY = delay
         self.TYPE = f'<{msg_struct}'
+        self.SCHEMA = MessageSchema(ASYNC, f'I{msg_struct}')  # Compiled once, type id ASYNC on the wire
         self.VERBOSE = verbose
 
+        if on_change and not isinstance(tolerance, (int, float)) and len(tolerance) != len(init_state):
+            print("The tolerance must be one value or one value per field of the initial state")
+            raise Exception
+
+        self.ON_CHANGE = on_change
+        self.TOLERANCE = [tolerance] * len(init_state) if isinstance(tolerance, (int, float)) else list(tolerance)
+        self.KEEPALIVE = keepalive
+        self._last_sent = None  # Last message sent in on_change mode
+        self._last_send_time = 0.0
+        self.VIEWS = views
+        self.EXPIRY = expiry
+        self.received_at = [None] * len(bt.RPIS_MACS)  # Reception time of the last message of each RPi
+        self.sequence = [-1] * len(bt.RPIS_MACS)  # Sequence number of the last message of each RPi
+
+        self.sent = 0  # Number of messages sent
+        self.suppressed = 0  # Number of sends skipped because the message did not change
+
+        self.profiler = None
+        if profile:
+            from profiler import RoundProfiler  # numpy is only needed when profiling
+            self.profiler = RoundProfiler(['send', 'wait', 'compute', 'delay'])
+        self._traffic = bt.process_stats(process_id)  # Bytes sent and received by this process, for the profiler
+
 
     def get_buffer(self):
         """
@@ -67,20 +103,83 @@ class Async:
             self.bluetooth.buffer[self.PROCESS] is [-1, -1, -1] before the first communication
             self.bluetooth.buffer[self.PROCESS] is [0x'xxxxxx', -1, 0x'xxxxxx'] after
             self.buffer is [[iteration1, value1], [-1, -1.0], [iteration2, value2]] after calling self.get_consensus
+
+        With expiry set, the rows of neighbors whose last message is older than expiry seconds are reset to -1.0.
         """
 
+        now = time.time()
         for i in range(len(self.buffer)):
-            if self.bluetooth.buffer[self.PROCESS][i] != -1:
-                temp = list(struct.unpack(self.TYPE, self.bluetooth.buffer[self.PROCESS][i]))
-                self.buffer[i][:] = temp
+            message, received_at = self.bluetooth.last_message(self.PROCESS, i)
+            if message != -1 and self.SCHEMA.matches(message):
+                self.received_at[i] = received_at
+                if self.EXPIRY is not None and now - self.received_at[i] > self.EXPIRY:
+                    self.buffer[i][:] = [-1.0] * len(self.buffer[i])
+                    self.sequence[i] = -1
+                    continue
+                values = self.SCHEMA.unpack(message)
+                self.sequence[i] = values[0]
+                self.buffer[i][:] = values[1:]
         self.buffer[self.bluetooth.ID] = self.message
+        self.received_at[self.bluetooth.ID] = now
+        self.sequence[self.bluetooth.ID] = self.sent
+
+
+    def views(self):
+        """
+        Return [(age (s), sequence number)] of the message in each row of self.buffer, None if there is none
+        (never received or expired). The sequence number counts the messages sent by the neighbor: a gap means
+        lost messages (e.g. dropped by the outbound queues), suppressed sends (see on_change) do not increment it.
+        """
+
+        now = time.time()
+        return [None if self.sequence[i] == -1 else (now - self.received_at[i], self.sequence[i])
+                for i in range(len(self.buffer))]
+
+
+    def _changed(self):
+        """
+        Return True if the message has to be sent: always, or in on_change mode if a field moved beyond its tolerance
+        since the last sent message or if the keepalive period elapsed
+        """
+
+        if not self.ON_CHANGE or self._last_sent is None or time.time() - self._last_send_time >= self.KEEPALIVE:
+            return True
+
+        for value, last, tolerance in zip(self.message, self._last_sent, self.TOLERANCE):
+            if isinstance(value, (bytes, str, bool)):
+                if value != last:
+                    return True
+            elif abs(value - last) > tolerance:
+                return True
+        return False
+
+
+    def _send(self):
+        """
+        Send the message to neighbors, unless it did not change in on_change mode
+        """
+
+        if not self._changed():
+            self.suppressed += 1
+            return
+
+        # Messages has the structure : [PROCESS_ID, ASYNC, sequence number, message] ([uchar, uchar, uint, msg_struct])
+        self.sent += 1
+        self.bluetooth.send_bytes(self.SCHEMA.pack(self.PROCESS, self.sent, *self.message))
+        self._last_sent = list(self.message)
+        self._last_send_time = time.time()
+
+
+    def _mark(self, phase):
+        if self.profiler is not None:
+            self.profiler.mark(phase)
 
 
     def run(self):
         """
         Run asynchronous communication
 
-            1. It sends a message to all neighbors
+            1. It sends a message to all neighbors (in on_change mode, only if it changed or for the keepalive)
             2. It fills the communication buffer with messages sent by neighbors
             4. Execute next_msg and assign new message
             5. Loop back to (1)
@@ -93,17 +192,21 @@ class Async:
         i = 0  # iteration value
         while True:
 
-            # Messages has the structure : [PROCESS_ID, iteration, state, ACK] ([short, short, self.TYPE, short])
-            self.bluetooth.send_message(f'<B{self.TYPE[1:]}', self.PROCESS, *self.message)  # Send state to neighbors
+            if self.profiler is not None:
+                self.profiler.start()
+                traffic = self._traffic.bytes_out, self._traffic.bytes_in
+
+            self._send()  # Send state to neighbors
+            self._mark('send')
 
             # Wait to receive initial neighbor's state
-            while any([self.bluetooth.buffer[self.PROCESS][n] == -1 for n in self.bluetooth.neighbors_index]):
-                time.sleep(1e-2)
-                continue
+            self.bluetooth.wait_for(self.PROCESS, lambda: all([self.bluetooth.buffer[self.PROCESS][n] != -1 for n in self.bluetooth.neighbors_index]))
+            self._mark('wait')
 
             self.get_buffer()  # Update neighbor's state knowledge
 
-            self.message = self.next_msg(self.buffer)  # Execute some tasks. It must return the next message as well
+            # Execute some tasks. It must return the next message as well
+            self.message = self.next_msg(self.buffer, self.views()) if self.VIEWS else self.next_msg(self.buffer)
 
             # For data saving
             self.data.append([time.time(), *self.message])
@@ -115,8 +218,13 @@ class Async:
             if self.VERBOSE:
                 print("state : ", self.message)
                 print()
+            self._mark('compute')
 
             # Optional delay
             time.sleep(self.DELAY)
+            self._mark('delay')
+
+            if self.profiler is not None:
+                self.profiler.end(self._traffic.bytes_out - traffic[0], self._traffic.bytes_in - traffic[1])
 
             i += 1
@@ -6,29 +6,72 @@ based on the Balboa self-balancing robot
 """
 
 
+import random
 import socket
 import threading
 import time
 import struct
+from collections import deque
+from framing import FrameParser, FrameError, encode_frame, encode_batch, split_batch, FLAG_CONTROL, FLAG_BATCH, \
+    FLAG_TIMESTAMP, FLAG_CRC, HELLO, HELLO_TYPE, BATCH_LENGTH, HEARTBEAT, HEARTBEAT_TYPE, READY, READY_TYPE, TIMESTAMP, HEADER, CRC
+from outbound import OutboundQueue
+from selector_engine import SelectorEngine
+from telemetry import LinkStats, ProcessStats, StatsDump
+from transport import RFCOMMTransport
 from utils import hex_str
 
 
 class Bluetooth:
-    def __init__(self, id, rpis_macs, adjacency, processes=1, verbose=False):
+    def __init__(self, id, rpis_macs, adjacency, processes=1, verbose=False, checksum=False, engine='threads',
+                 transport=None, queue_size=64, send_queue=64, send_policy='drop_oldest',
+                 batch=None, heartbeat=None, dead_timeout=None, retry_min=0.1, retry_max=5.0, timestamps=False,
+                 rendezvous=False):
         """
         rpis_macs: list of MAC addresses of each RPi
         id: index of the current RPi in rpis_macs
         verbose: bool for showing each sent/received msg
         adjacency: adjacent adjacency for connections between rpis. Default: queue.
+        checksum: bool for appending a CRC32 to each sent frame (corrupted frames are dropped at reception)
+        engine: 'threads' (one thread per connection) or 'selector' (every socket handled by one event loop thread)
+        transport: sockets used for connections (see transport.py). Default: RFCOMMTransport().
+            With TCPTransport or UnixTransport, rpis_macs are the addresses of this transport instead of MAC addresses,
+            which allows running a whole virtual swarm on one computer (see launcher.py).
+        queue_size: number of received messages kept for each process by receive()
+        send_queue: maximum number of frames waiting to be written for each neighbor
+        send_policy: 'drop_oldest', 'drop_newest' or 'block' when the queue of a neighbor is full (see outbound.py).
+            Dropped messages are lost for the protocol layers: they are counted in process_stats(p).dropped, and
+            'block' should be used when every message matters (Flooding, Unicast) rather than the latest state.
+        batch: optional flush window in seconds (e.g. 2e-3). Messages queued for a neighbor within this window are
+            merged into one frame, so that one write is done per neighbor (e.g. state and ACK of several processes).
+        heartbeat: optional period in seconds of heartbeats sent to each neighbor
+        dead_timeout: a connection without any received frame for dead_timeout seconds is closed (default: 3 heartbeats)
+        retry_min, retry_max: bounds of the exponential backoff between connection attempts with a neighbor (each
+            delay is jittered, so that neighbors do not retry in lockstep).
+            Lost connections are dialed again automatically by the neighbor that has the lower MAC address.
+        timestamps: bool for embedding the send time in each frame (8 bytes), giving one-way latency estimates in stats().
+            They include the clock offset between both RPis; heartbeats also measure the round trip time without it.
+        rendezvous: bool for sending a ready message on each new connection as soon as it is registered: a link is
+            only considered up by start_network once the ready message of the neighbor has arrived, i.e. the neighbor
+            has registered the connection too and its frames reach this RPi.
 
         Remark: RPi's need to be paired manually for the first time.
         """
 
         # Private constants
-        self._PORT = 1
+        self._TRANSPORT = transport if transport is not None else RFCOMMTransport()
         self._MAC = rpis_macs[id]
         self._VERBOSE = verbose  # Show received and sent messages
         self._PROCESSES = processes
+        self._CHECKSUM = checksum
+        self._SEND_QUEUE = send_queue
+        self._SEND_POLICY = send_policy
+        self._BATCH = batch
+        self._HEARTBEAT = heartbeat
+        self._DEAD_TIMEOUT = dead_timeout if dead_timeout is not None or heartbeat is None else 3 * heartbeat
+        self._RETRY_MIN = retry_min
+        self._RETRY_MAX = retry_max
+        self._TIMESTAMPS = timestamps
+        self._RENDEZVOUS = rendezvous
 
         # Public constants
         self.ADJACENCY = adjacency
@@ -37,6 +80,31 @@ class Bluetooth:
 
         # Private variables
         self._connections = {}
+        self._engine = None
+        self._conditions = [threading.Condition() for _ in range(processes)]  # Notified at each received message
+        self._queues = [deque(maxlen=queue_size) for _ in range(processes)]  # (sequence, index, message) not yet received
+        self._sequences = [0] * processes  # Local sequence number of the last message received by each process
+        self._received_at = [[None] * len(rpis_macs) for _ in range(processes)]  # Reception time of each buffer row
+        self._callbacks = [[] for _ in range(processes)]
+        self._outbound = {}  # mac: OutboundQueue of the connection
+        self._links = threading.Condition()  # Notified when a connection is added or removed
+        self._link_callbacks = []
+        self._last_seen = [0.0] * len(rpis_macs)  # Time of the last frame received from each RPi
+        self._retry_delays = {}  # mac: delay before the next connection attempt
+        self._monitor_thread = None
+        self._link_stats = [LinkStats() for _ in rpis_macs]  # Traffic with each RPi
+        self._process_stats = [ProcessStats() for _ in range(processes)]
+        self._heartbeats = [None] * len(rpis_macs)  # (send time, reception time) of the last heartbeat of each RPi
+        self._ready = [False] * len(rpis_macs)  # Ready message received on the connection with each RPi
+        self._failed_attempts = {}  # mac: number of failed connection attempts
+        self._bringup = {}  # ID: {'connected', 'ready', 'failed'} times (s) since start_network of each neighbor
+        self._start_time = None
+
+        if engine == 'selector':
+            self._engine = SelectorEngine(self)
+        elif engine != 'threads':
+            print("engine must be 'threads' or 'selector'")
+            raise Exception
 
         # Public variables
         self.buffer = []
@@ -78,40 +146,48 @@ class Bluetooth:
                 self.neighbors.append(self.RPIS_MACS[i])
                 self.neighbors_index.append(i)
 
-        if len(self.neighbors) > 7:
-            print("Each RPi can connect to a maximum of 7 peripherals due to Bluetooth limitations.")
+        max_neighbors = self._TRANSPORT.MAX_NEIGHBORS
+        if max_neighbors is not None and len(self.neighbors) > max_neighbors:
+            print(f"Each RPi can connect to a maximum of {max_neighbors} peripherals due to Bluetooth limitations.")
             raise Exception
 
 
     def handle_client(self, conn, addr):
         """
-        Receive full_low_scale for each connection, either for a server or a connector
+        Receive messages for each connection, either for a server or a connector
         As soon as a connection is made, a thread run this function to manage self.buffer
+
+        The stream is cut into frames (see framing.py), each frame being one message of send_message.
+        addr is None when the transport does not identify peers: it is then read from the hello frame of the connector.
         """
 
+        parser = FrameParser()
+        if addr is None:
+            addr = self._identify(conn, parser)
+            if addr is None or addr in self._connections:
+                conn.close()
+                return
+            self._register(addr, conn)
+
         print(f"Connected to {addr}")
+        if addr not in self.RPIS_MACS:
+            print(f"Unknown address {addr}, connection closed.")
+            conn.close()
+            return
+
+        index = self.RPIS_MACS.index(addr)
         while True:
             try:
-                data = conn.recv(1024)
-                if not data:  # Client a fermé la connexion proprement
+                for flags, payload in parser.frames():
+                    self._handle_frame(index, flags, payload)
+
+                if parser.recv_into(conn) == 0:  # Client closed the connection
                     print(f"Client {addr} closed the connection.")
                     break
 
-                if self._VERBOSE:
-                    print(f"\nMessage from {addr}: {hex_str(data)}")
-
-                for i in range(len(self.RPIS_MACS)):
-                    if addr == self.RPIS_MACS[i]:
-                        try:
-                            if len(data) >= 1:  # Vérifie que la donnée contient au moins 1 octets
-                                p = data[0]
-                                if 0 <= p < self._PROCESSES:
-                                    self.buffer[p][i] = data[1:]
-                            else:
-                                raise ValueError("Received data too short")
-                        except Exception as e:
-                            print(f"Data processing error from {addr}: {e}")
-                            self.buffer[0][i] = data
+            except FrameError as e:
+                print(f"Framing error with {addr}: {e}")
+                break
             except (ConnectionResetError, BrokenPipeError):
                 print(f"Connection lost with {addr}")
                 break
@@ -121,9 +197,327 @@ class Bluetooth:
 
         print(f"Disconnected from {addr}")
         conn.close()
+        self._unregister(addr, conn)
+
+
+    def _handle_frame(self, index, flags, payload):
+        """
+        Deliver the message(s) of a received frame
+        """
+
+        now = time.time()
+        self._last_seen[index] = now
+        link = self._link_stats[index]
+        link.received(HEADER.size + len(payload) + (CRC.size if flags & FLAG_CRC else 0), now)
+
+        if flags & FLAG_TIMESTAMP:
+            link.latency(now - TIMESTAMP.unpack_from(payload)[0])
+            payload = payload[TIMESTAMP.size:]
+
+        if flags & FLAG_CONTROL:
+            if len(payload) == READY.size and payload[0] == READY_TYPE:
+                with self._links:
+                    self._ready[index] = True
+                    self._record_bringup(index, 'ready')
+                    self._links.notify_all()
+            elif len(payload) == HEARTBEAT.size and payload[0] == HEARTBEAT_TYPE:
+                _, sent, echo, hold = HEARTBEAT.unpack(payload)
+                self._heartbeats[index] = (sent, now)  # Send time echoed back, for the round trip time
+                if echo > 0:
+                    link.round_trip(now - echo - hold)
+            return
+
+        messages = split_batch(payload) if flags & FLAG_BATCH else [payload]
+        for message in messages:
+            if self._VERBOSE:
+                print(f"\nMessage from {self.RPIS_MACS[index]}: {hex_str(message)}")
+            self._deliver(index, message)
+
+
+    def _pack(self, messages, index):
+        """
+        Return the bytes to write to RPi index for a list of queued (flags, payload)
+        In batch mode, consecutive messages are merged into batch frames, otherwise there is one frame per message.
+        """
+
+        timestamp = time.time() if self._TIMESTAMPS else None
+        frames = []
+        batch = []
+        for flags, payload in messages + [(None, None)]:
+            if self._BATCH is not None and flags == 0 and len(payload) < 1 << 8 * BATCH_LENGTH.size:
+                batch.append(payload)
+                continue
+
+            if len(batch) == 1:
+                frames.append(encode_frame(batch[0], self._CHECKSUM, 0, timestamp))
+            elif batch:
+                frames.append(encode_batch(batch, self._CHECKSUM, timestamp))
+            batch = []
+
+            if payload is not None:
+                frames.append(encode_frame(payload, self._CHECKSUM, flags, timestamp))
+
+        data = b''.join(frames)
+        self._link_stats[index].sent(len(frames), len(data))
+        return data
+
+
+    def _register(self, mac, conn):
+        """
+        Add an established connection, with its outbound queue (and its writer thread for the 'threads' engine)
+        """
+
+        queue = OutboundQueue(self._SEND_QUEUE, self._SEND_POLICY, on_drop=self._dropped)
+        index = self.RPIS_MACS.index(mac)
+        self._last_seen[index] = time.time()
+        self._retry_delays.pop(mac, None)
+
+        with self._links:
+            self._outbound[mac] = queue
+            self._connections[mac] = conn
+            self._ready[index] = False
+            self._record_bringup(index, 'connected')
+            self._links.notify_all()
+
+        if self._RENDEZVOUS:
+            queue.put((FLAG_CONTROL, READY.pack(READY_TYPE)))
+
+        if self._engine is None:
+            threading.Thread(target=self._writer, args=(mac, conn, queue), daemon=True).start()
+        elif self._RENDEZVOUS:
+            self._engine.notify(mac)
+
+        self._link_event(index, True)
+
+
+    def _unregister(self, mac, conn):
+        with self._links:
+            if self._connections.get(mac) is not conn:
+                return
+            del self._connections[mac]
+            self._outbound.pop(mac).close()
+            self._ready[self.RPIS_MACS.index(mac)] = False
+            self._links.notify_all()
+
+        self._link_event(self.RPIS_MACS.index(mac), False)
+
+
+    def _link_event(self, index, up):
+        for callback in self._link_callbacks:
+            try:
+                callback(index, up)
+            except Exception as e:
+                print(f"Link callback error: {e}")
+
+
+    def subscribe_links(self, callback):
+        """
+        Call callback(index, up) each time the connection with neighbor index is established (up) or lost
+        """
+
+        self._link_callbacks.append(callback)
+
+
+    def _next_retry(self, mac):
+        """
+        Return the delay before the next connection attempt with mac (exponential backoff, jittered in [delay/2, delay])
+        """
+
+        self._failed_attempts[mac] = self._failed_attempts.get(mac, 0) + 1
+        delay = self._retry_delays.get(mac, self._RETRY_MIN)
+        self._retry_delays[mac] = min(2 * delay, self._RETRY_MAX)
+        return delay * random.uniform(0.5, 1.0)
 
-        if addr in self._connections:
-            del self._connections[addr]
+
+    def _record_bringup(self, index, step):
+        """
+        Record the time of a bring-up step ('connected' or 'ready') of the link with RPi index, during start_network
+        """
+
+        if self._start_time is None or step in self._bringup.get(index, {}):
+            return
+        times = self._bringup.setdefault(index, {})
+        times[step] = time.time() - self._start_time
+        times['failed'] = self._failed_attempts.get(self.RPIS_MACS[index], 0)
+
+
+    def connected(self, index):
+        """
+        Return True if a connection with RPi index is open
+        """
+
+        return self.RPIS_MACS[index] in self._connections
+
+
+    def _link_ready(self, index):
+        return self.RPIS_MACS[index] in self._connections and (self._ready[index] or not self._RENDEZVOUS)
+
+
+    def _monitor(self):
+        """
+        Send heartbeats and close connections that have been silent for more than self._DEAD_TIMEOUT seconds
+        """
+
+        while True:
+            time.sleep(self._HEARTBEAT)
+
+            now = time.time()
+            for mac, conn in list(self._connections.items()):
+                index = self.RPIS_MACS.index(mac)
+                if now - self._last_seen[index] > self._DEAD_TIMEOUT:
+                    print(f"No message from {mac} for {self._DEAD_TIMEOUT}s, connection closed.")
+                    try:
+                        conn.shutdown(socket.SHUT_RDWR)  # The receiving side will notice it and unregister it
+                    except OSError:
+                        pass
+                    continue
+
+                # Echo the last heartbeat of this neighbor for its round trip measurement
+                echo, hold = 0.0, 0.0
+                if self._heartbeats[index] is not None:
+                    echo, hold = self._heartbeats[index][0], now - self._heartbeats[index][1]
+
+                heartbeat = (FLAG_CONTROL, HEARTBEAT.pack(HEARTBEAT_TYPE, now, echo, hold))
+                queue = self._outbound.get(mac)
+                if queue is not None and queue.put(heartbeat) and self._engine is not None:
+                    self._engine.notify(mac)
+
+
+    def _writer(self, mac, conn, queue):
+        """
+        Write the messages queued for one connection ('threads' engine)
+        """
+
+        while True:
+            message = queue.get()
+            if message is None:  # Connection closed
+                return
+
+            if self._BATCH is not None:
+                time.sleep(self._BATCH)  # Flush window: let the other messages of this tick be queued
+
+            try:
+                conn.sendall(self._pack([message] + queue.get_all(), self.RPIS_MACS.index(mac)))
+            except OSError:
+                print(f"Sending error to {mac}")
+                self._link_stats[self.RPIS_MACS.index(mac)].send_errors += 1
+                queue.close()
+                try:
+                    conn.shutdown(socket.SHUT_RDWR)  # handle_client will notice it and unregister the connection
+                except OSError:
+                    pass
+                return
+
+
+    def _identify(self, conn, parser):
+        """
+        Read the hello frame that a connector sends first and return its address (None if invalid)
+        """
+
+        conn.settimeout(5)
+        try:
+            while True:
+                for flags, payload in parser.frames():
+                    if flags & FLAG_CONTROL and len(payload) == HELLO.size and payload[0] == HELLO_TYPE:
+                        id = HELLO.unpack(payload)[1]
+                        if 0 <= id < len(self.RPIS_MACS):
+                            return self.RPIS_MACS[id]
+                    print("Invalid hello frame, connection closed.")
+                    return None
+
+                if parser.recv_into(conn) == 0:
+                    return None
+        except (OSError, FrameError):
+            return None
+        finally:
+            conn.settimeout(None)
+
+
+    def _hello(self):
+        return encode_frame(HELLO.pack(HELLO_TYPE, self.ID), self._CHECKSUM, FLAG_CONTROL)
+
+
+    def _deliver(self, index, payload):
+        """
+        Place a received message from RPi index into the row of its process in self.buffer
+        """
+
+        if len(payload) < 1:
+            print(f"Data processing error from {self.RPIS_MACS[index]}: received data too short")
+            return
+
+        p = payload[0]
+        if not 0 <= p < self._PROCESSES:
+            print(f"Data processing error from {self.RPIS_MACS[index]}: unknown process {p}")
+            return
+
+        message = payload[1:]
+        self._process_stats[p].received(len(message))
+        with self._conditions[p]:
+            self.buffer[p][index] = message
+            self._received_at[p][index] = time.time()
+            self._sequences[p] += 1
+            self._queues[p].append((self._sequences[p], index, message))
+            self._conditions[p].notify_all()
+
+        for callback in self._callbacks[p]:
+            try:
+                callback(index, message)
+            except Exception as e:
+                print(f"Callback error of process {p}: {e}")
+
+
+    def subscribe(self, process, callback):
+        """
+        Call callback(index, message) each time a message of process is received from RPi index
+
+        The callback is run by the receiving thread: it has to be short and must not block.
+        """
+
+        self._callbacks[process].append(callback)
+
+
+    def unsubscribe(self, process, callback):
+        if callback in self._callbacks[process]:
+            self._callbacks[process].remove(callback)
+
+
+    def wait_for(self, process, predicate, timeout=None):
+        """
+        Block until predicate() is True, it is evaluated again each time a message of process is received
+        Returns the last value of predicate() (False if timeout seconds elapsed before).
+
+        Replaces polling of self.buffer with sleeps: the caller wakes up as soon as the message arrives.
+        """
+
+        with self._conditions[process]:
+            return self._conditions[process].wait_for(predicate, timeout)
+
+
+    def last_message(self, process, index):
+        """
+        Return (message, reception time) of the last message of RPi index for process, (-1, None) if there is none
+
+        Both are read together under the lock of the process, so the time always belongs to the message.
+        """
+
+        with self._conditions[process]:
+            return self.buffer[process][index], self._received_at[process][index]
+
+
+    def receive(self, process, timeout=None):
+        """
+        Return the oldest message of process not yet received as (sequence, index, message), None after timeout seconds
+
+        Unlike self.buffer, that only keeps the last message of each RPi, every message is returned once, even if it
+        is identical to the previous one (up to queue_size messages are kept, the oldest are dropped beyond).
+        sequence is a local number incremented at each received message of process: a gap means dropped messages.
+        """
+
+        with self._conditions[process]:
+            if self._conditions[process].wait_for(lambda: self._queues[process], timeout):
+                return self._queues[process].popleft()
+            return None
 
 
     def start_server(self):
@@ -131,17 +525,20 @@ class Bluetooth:
         Server : Listen for connections with neighbors that has lower MAC address.
         """
 
-        server = socket.socket(socket.AF_BLUETOOTH, socket.SOCK_STREAM, socket.BTPROTO_RFCOMM)
-        server.bind((self.RPIS_MACS[self.ID], self._PORT))
-        server.listen(5)
+        server = self._TRANSPORT.listen(self._MAC)
         print("Server ready to receive connections...")
 
         while True:
             try:
-                client, mac = server.accept()
-                if mac[0] not in self._connections:
-                    self._connections[mac[0]] = client
-                    threading.Thread(target=self.handle_client, args=(client, mac[0]), daemon=True).start()
+                client, addr = server.accept()
+                mac = self._TRANSPORT.peer(addr)
+                if mac is None:  # Identified by its hello frame
+                    threading.Thread(target=self.handle_client, args=(client, None), daemon=True).start()
+                elif mac not in self._connections:
+                    self._register(mac, client)
+                    threading.Thread(target=self.handle_client, args=(client, mac), daemon=True).start()
+                else:
+                    client.close()
             except:
                 break
         server.close()
@@ -150,29 +547,34 @@ class Bluetooth:
     def connect_to_neighbor(self, mac):
         """
         Client : Initiate connection with neighbors that has higher MAC address.
+        The connection is dialed again each time it is lost, with an exponential backoff between attempts.
         """
 
         while True:
-            try:
-                if mac in self._connections:
-                    return  # Already connected
+            # Wait for the connection to be lost
+            with self._links:
+                self._links.wait_for(lambda: mac not in self._connections)
 
+            client = self._TRANSPORT.socket()
+            try:
                 print(f"Connection to {mac}...")
-                client = socket.socket(socket.AF_BLUETOOTH, socket.SOCK_STREAM, socket.BTPROTO_RFCOMM)
-                client.connect((mac, self._PORT))
-                self._connections[mac] = client
-                print(f"Connected to {mac}")
+                client.connect(self._TRANSPORT.address(mac))
+                if not self._TRANSPORT.IDENTIFIES_PEER:
+                    client.sendall(self._hello())
+                self._register(mac, client)
 
                 threading.Thread(target=self.handle_client, args=(client, mac), daemon=True).start()
 
-            except:
-                print(f"Impossible to connect with {mac}, new attempt in 5s...")
-                time.sleep(5)
+            except OSError:
+                client.close()
+                delay = self._next_retry(mac)
+                print(f"Impossible to connect with {mac}, new attempt in {delay:.2f}s...")
+                time.sleep(delay)
 
 
     def send_message(self, type, *args, dest=None):
         """
-        Send messages to specified agents
+        Send messages to specified agents, returns immediately (messages are queued for each receiver)
 
         type: Need to be specified using struct definitions. For example '<hf' is a short followed by a float in little endian.
         args: An undetermined number of variables that will be sent.
@@ -180,6 +582,17 @@ class Bluetooth:
         Default: destination is everyone is dest is None
         """
 
+        self.send_bytes(struct.pack(type, *args), dest)
+
+
+    def send_bytes(self, payload, dest=None):
+        """
+        Send an already packed message (starting with the process id, e.g. MessageSchema.pack) to specified agents
+
+        dest []: list of the IDs of the destination agents
+        Default: destination is everyone is dest is None
+        """
+
         receivers = {}
         if dest is None:
             receivers = self._connections
@@ -198,19 +611,125 @@ class Bluetooth:
                 raise TypeError
 
 
-        for mac, conn in receivers.items():
+        if payload and 0 <= payload[0] < self._PROCESSES:
+            self._process_stats[payload[0]].sent(len(payload) - 1, len(receivers))
 
-            try:
-                conn.send(struct.pack(type, *args))
-                if self._VERBOSE:
-                    print(f"Send {args} to {mac}")
-            except:
+        for mac in list(receivers):
+
+            # Queued, written by the writer of the connection: a slow neighbor does not delay the others
+            queue = self._outbound.get(mac)
+            if queue is None or not queue.put((0, payload)):
                 print(f"Sending error to {mac}")
+                self._link_stats[self.RPIS_MACS.index(mac)].send_errors += 1
+                continue
+            if self._engine is not None:
+                self._engine.notify(mac)
+            if self._VERBOSE:
+                print(f"Send {hex_str(payload)} to {mac}")
+
+
+    def _dropped(self, message):
+        """
+        Count a message dropped by an outbound queue against its process (control frames are not counted)
+        """
+
+        flags, payload = message
+        if not flags & FLAG_CONTROL and payload and 0 <= payload[0] < self._PROCESSES:
+            self._process_stats[payload[0]].dropped += 1
+
+
+    def queue_stats(self):
+        """
+        Return {ID: {'depth', 'max_depth', 'sent', 'dropped'}} of the outbound queue of each connected neighbor
+        """
+
+        return {self.RPIS_MACS.index(mac): queue.stats() for mac, queue in list(self._outbound.items())}
+
+
+    def stats(self):
+        """
+        Return a snapshot of the telemetry counters (see telemetry.py):
+            'time': time of the snapshot
+            'links': {ID: counters of the traffic with each neighbor (frames, bytes, send errors, inter-arrival
+                     histogram, one_way latency and rtt averages)}
+            'processes': {process: counters of its messages}
+            'queues': queue_stats()
+        """
+
+        return {'time': time.time(), 'id': self.ID,
+                'links': {i: self._link_stats[i].snapshot() for i in self.neighbors_index},
+                'processes': {p: stats.snapshot() for p, stats in enumerate(self._process_stats)},
+                'queues': self.queue_stats()}
+
+
+    def process_stats(self, process):
+        """
+        Return the live counters of the messages of process (ProcessStats: messages_in, bytes_in, messages_out, bytes_out)
+        """
 
+        return self._process_stats[process]
 
-    def start_network(self):
+
+    def link_stats(self, index):
+        """
+        Return the live counters of the link with RPi index (LinkStats: frames, bytes, send errors, one_way, rtt, ...)
+        """
+
+        return self._link_stats[index]
+
+
+    def dump_stats(self, file_path, period=1.0):
+        """
+        Append stats() to file_path every period seconds (CSV if file_path ends with '.csv', JSON lines otherwise)
+        Returns the StatsDump, stop() ends it. E.g. '/home/trebelge/Documents/Balboa_Network/data/links.csv'
+        """
+
+        return StatsDump(self, file_path, period)
+
+
+    def start_network(self, timeout=None):
         """
-        Establish connections with all neighbors and wait for them to be established.
+        Establish connections with all neighbors and wait for them to be established (and confirmed in rendezvous mode).
+        Returns the bring-up times of each neighbor {ID: {'connected', 'ready', 'failed'}}, also printed, or None if
+        some neighbors are still missing after timeout seconds.
+        """
+
+        self._start_time = time.time()
+        self._bringup = {}
+        if self._engine is not None:
+            self._engine.start()
+        else:
+            self._start_threads()
+
+        if self._HEARTBEAT is not None and self._monitor_thread is None:
+            self._monitor_thread = threading.Thread(target=self._monitor, daemon=True)
+            self._monitor_thread.start()
+
+        # Woken up at each new connection or ready message
+        with self._links:
+            ready = self._links.wait_for(lambda: all(self._link_ready(i) for i in self.neighbors_index), timeout)
+
+        duration = time.time() - self._start_time
+        self._start_time = None
+        if not ready:
+            missing = [mac for i, mac in zip(self.neighbors_index, self.neighbors) if not self._link_ready(i)]
+            print(f"Neighbors still not connected after {duration:.2f}s: {missing}")
+            return None
+
+        print(f"Every neighbors are connected! ({duration:.2f}s)")
+        slowest = max(self._bringup, key=lambda i: self._bringup[i].get('ready', self._bringup[i]['connected']), default=None)
+        for i, times in sorted(self._bringup.items()):
+            line = f"    {self.RPIS_MACS[i]}: connected after {times['connected']:.3f}s ({times['failed']} failed attempts)"
+            if 'ready' in times:
+                line += f", ready after {times['ready']:.3f}s"
+            print(line + (" <- slowest" if i == slowest else ""))
+        print()
+        return self._bringup
+
+
+    def _start_threads(self):
+        """
+        Start server and connection threads of the 'threads' engine
         """
 
         # If a neighbor need to connect, start server in parallel
@@ -223,13 +742,3 @@ class Bluetooth:
         for neighbor in self.neighbors:
             if neighbor > self._MAC:
                 threading.Thread(target=self.connect_to_neighbor, args=(neighbor,), daemon=True).start()
-
-        # Wait to be connected with each neighbor
-        ready = False
-        while not ready:
-            time.sleep(1)
-            ready = len(self._connections) == len(self.neighbors)
-
-        time.sleep(1)
-        print("Every neighbors are connected!")
-        print()
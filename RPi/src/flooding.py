@@ -6,67 +6,288 @@ based on the Balboa self-balancing robot
 """
 
 
+import random
+import struct
 import time
 import threading
-import struct
-from collections import namedtuple
-from copy import deepcopy
+from collections import OrderedDict, deque, namedtuple
+from schema import MessageSchema, BROADCAST, FRAGMENT, FRAGMENT_REQUEST, register, decode
 
-# Message structure
+# Message structure (viewers: bitmap of the IDs of the RPis reached, bit i for RPi i)
 BroadcastMessage = namedtuple('Message', ['id', 'sender', 'size', 'data', 'viewers'])
 
+# Chunk of a fragmented broadcast, flooded on its own (chunk: index of the chunk, count: number of chunks)
+# The chunk of index count is the end marker of the broadcast: it carries no data, its viewers are the RPis that
+# have reassembled the whole message
+FragmentMessage = namedtuple('FragmentMessage', ['id', 'sender', 'chunk', 'count', 'size', 'data', 'viewers'])
+
+# Request of missing chunks of a fragmented broadcast, sent to one neighbor (size: number of chunks requested)
+FragmentRequest = namedtuple('FragmentRequest', ['id', 'sender', 'size', 'chunks'])
+
+LISTEN_TIMEOUT = 0.5  # Period (s) at which the listening thread checks that it has to go on
+FRAGMENT_POLL = 1e-3  # Period (s) at which a fragmented broadcast checks its outbound queues
+FRAGMENT_TIMEOUT = 1.0  # Maximum wait (s) before sending the next chunk, and before requesting missing chunks
+
+# Wire format: [id (ushort), sender (uchar), size (ushort)], then tail: [data (size bytes), viewers (bitmap)]
+# The viewers bitmap has a fixed width of one bit per RPi of the swarm, rounded up to bytes (little endian)
+BROADCAST_SCHEMA = register(MessageSchema(
+    BROADCAST, 'HBH',
+    encode_tail=lambda data, viewers, width: data + viewers.to_bytes(width, 'little'),
+    decode_tail=lambda fixed, view: (bytes(view[:fixed[2]]), int.from_bytes(view[fixed[2]:], 'little'))
+))
+
+# Wire format: [id (ushort), sender (uchar), chunk, count, size (ushort)], then tail: [data (size bytes), viewers (bitmap)]
+FRAGMENT_SCHEMA = register(MessageSchema(
+    FRAGMENT, 'HBHHH',
+    encode_tail=lambda data, viewers, width: data + viewers.to_bytes(width, 'little'),
+    decode_tail=lambda fixed, view: (bytes(view[:fixed[4]]), int.from_bytes(view[fixed[4]:], 'little'))
+))
+
+# Wire format: [id (ushort), sender (uchar), size (ushort)], then tail: [chunks (size ushort)]
+FRAGMENT_REQUEST_SCHEMA = register(MessageSchema(
+    FRAGMENT_REQUEST, 'HBH',
+    encode_tail=lambda chunks: struct.pack(f'<{len(chunks)}H', *chunks),
+    decode_tail=lambda fixed, view: (struct.unpack_from(f'<{fixed[2]}H', view),)
+))
+
+
+def reached(viewers):
+    """
+    Return the number of RPis in the viewers bitmap
+    """
+
+    return bin(viewers).count('1')
+
+
+def multipoint_relays(adjacency, node):
+    """
+    Return the multipoint relays of node: a subset of its neighbors that reaches every node at 2 hops
+
+    Greedy selection of OLSR: first the neighbors that are the only ones to reach a 2-hop node, then the neighbor
+    reaching the most 2-hop nodes not yet reached (lowest ID on ties). Every RPi knows the whole adjacency and then
+    computes the same relays for each node.
+    """
+
+    neighbors = {i for i in range(len(adjacency)) if i != node and adjacency[node][i] == 1}
+    reach = {n: {i for i in range(len(adjacency)) if adjacency[n][i] == 1} - neighbors - {node} for n in neighbors}
+    two_hops = set().union(*reach.values())
+
+    relays = set()
+    for target in two_hops:
+        covering = [n for n in neighbors if target in reach[n]]
+        if len(covering) == 1:
+            relays.add(covering[0])
+
+    uncovered = two_hops - set().union(set(), *(reach[n] for n in relays))
+    while uncovered:
+        best = max(sorted(neighbors - relays), key=lambda n: len(reach[n] & uncovered))
+        relays.add(best)
+        uncovered -= reach[best]
+    return relays
+
+
+def hops(adjacency, node):
+    """
+    Return the number of hops from node to each RPi (breadth-first search, None if unreachable)
+    """
+
+    distances = [None] * len(adjacency)
+    distances[node] = 0
+    frontier = [node]
+    while frontier:
+        following = []
+        for i in frontier:
+            for j in range(len(adjacency)):
+                if adjacency[i][j] == 1 and distances[j] is None:
+                    distances[j] = distances[i] + 1
+                    following.append(j)
+        frontier = following
+    return distances
+
 
 class Flooding:
-    def __init__(self, bt, rocky, process_id=0, verbose=True, delay=0):
+    def __init__(self, bt, rocky, process_id=0, verbose=True, delay=0, cache_size=256,
+                 relay='flood', probability=0.7, threshold=3, assessment_delay=0.05, fragment_size=512, window=8):
+        """
+        cache_size: number of floods (origin, id) remembered to suppress duplicates, the least recently seen are
+                    forgotten beyond (each chunk of a fragmented broadcast is a flood, a broadcast must then have
+                    less than cache_size chunks)
+        fragment_size: broadcasts larger than fragment_size bytes are split into chunks of this size
+        window: a fragmented broadcast waits before sending a chunk while an outbound queue holds window frames, and
+                missing chunks are requested window at a time
+        relay: strategy of the RPis forwarding a flood
+            - 'flood': forward it to every neighbor each time its viewers change (completion known by every RPi)
+            - 'mpr': forward the first copy coming from a neighbor of which this RPi is a multipoint relay (RFC 3626:
+                     copies from other neighbors are not forwarded, but do not prevent a later copy from being so)
+            - 'counter': forward its first copy after a random delay (up to assessment_delay seconds) unless
+                         threshold copies have been received in the meantime
+            - 'gossip': forward its first copy with probability
+            Except with 'flood', the copy is only sent to the neighbors not yet in its viewers, and completion
+            (callback, ready) is only known when a copy carrying every viewer comes back.
+            Chunks of fragmented broadcasts are forwarded once, also with 'flood' (see _send_fragments).
+        """
+
+        if relay not in ('flood', 'mpr', 'counter', 'gossip'):
+            print("relay must be 'flood', 'mpr', 'counter' or 'gossip'")
+            raise Exception
 
         # Public variables
-        self.buffer = [BroadcastMessage(0, -1, 0, b"", set()) for _ in range(len(bt.RPIS_MACS))]
+        self.buffer = [BroadcastMessage(0, -1, 0, b"", 0) for _ in range(len(bt.RPIS_MACS))]
         self.last_message = None
-        self.ready = True
+        self.sequence = 0  # Local sequence number of the last handled message
+        self.ready = True  # No flood in flight
         self.data = []
+        self.transmissions = 0  # Messages sent to a neighbor (one per neighbor for each forwarded copy)
+        self.delivered = 0  # Floods of other RPis received
+        self.dropped = 0  # Messages of this process dropped by Bluetooth (outbound queues, disconnected neighbors)
 
         # Private variables
         self._listening = False
         self._bluetooth = bt
         self._rocky = rocky
-        self._all_rpis_id = set(range(len(self._bluetooth.RPIS_MACS)))
+        self._all_rpis_id = (1 << len(bt.RPIS_MACS)) - 1  # Viewers bitmap of the whole swarm
         self._message_id = 0
-        self._last_viewers = set()
+        self._floods = OrderedDict()  # (origin, id): viewers bitmap of the floods seen, least recently seen first
+        self._in_flight = set()  # (origin, id) of the floods not yet completed
+        self._callbacks = {}  # (origin, id): callback of the floods initiated by this RPi
+        self._lock = threading.RLock()  # Callbacks may broadcast
+        self._copies = {}  # (origin, id): copies received during the assessment delay (relay='counter')
+        self._retransmitted = set()  # (origin, id) of the floods already forwarded or given up (except relay='flood')
+        self._fragments = OrderedDict()  # (origin, id): chunks (None if missing) of the fragmented broadcasts
+        self._recovery = {}  # (origin, id): [time of the last chunk or request, chunks requested, neighbor asked]
 
         # Private constants
         self._PROCESS = process_id
         self._VERBOSE = verbose
         self._ID = bt.ID
+        self._BIT = 1 << bt.ID  # Bit of this RPi in viewers bitmaps
+        self._WIDTH = (len(bt.RPIS_MACS) + 7) // 8  # Size of viewers bitmaps on the wire (bytes)
         self._DELAY = delay
+        self._CACHE_SIZE = cache_size
+        self._FRAGMENT_SIZE = fragment_size
+        self._WINDOW = window
+        self._RELAY = relay
+        self._PROBABILITY = probability
+        self._THRESHOLD = threshold
+        self._ASSESSMENT_DELAY = assessment_delay
+        # Neighbors of which this RPi is a multipoint relay (relay='mpr')
+        self._SELECTORS = {n for n in bt.neighbors_index if bt.ID in multipoint_relays(bt.ADJACENCY, n)}
+
+        # Every message is kept until handled: a flood only completes once each of its viewer updates has been merged,
+        # the bounded queue of bluetooth.receive would drop some in bursts
+        self._inbox = deque()  # (index, message) received and not yet handled
+        self._arrived = threading.Condition()  # Notified at each received message
+        bt.subscribe(process_id, self._on_message)
+
+
+    def broadcast(self, data: str, callback=None):
+        """
+        Initiate broadcast to all agents, other floods may be in flight
 
+        data: message to be sent (str, or bytes e.g. a config file)
+        callback: optional function called with the message once every agent has been reached
 
-    def broadcast(self, data: str):
+        A message larger than fragment_size bytes is split into chunks sent by a thread (see _send_fragments), it
+        must have less than cache_size chunks.
         """
-        Initiate broadcast to all agents
 
-        data: message to be sent
+        data_byte = data.encode('utf-8') if isinstance(data, str) else bytes(data)
+        with self._lock:
+            self._message_id = (self._message_id + 1) % 65536  # ushort on the wire
+
+            if len(data_byte) > self._FRAGMENT_SIZE:
+                chunks = [data_byte[i:i + self._FRAGMENT_SIZE] for i in range(0, len(data_byte), self._FRAGMENT_SIZE)]
+                if len(chunks) >= min(self._CACHE_SIZE, 65536):
+                    print("The message has too many chunks, fragment_size or cache_size has to be increased")
+                    raise Exception
+
+                key = (self._ID, self._message_id)
+                self._store(key, chunks)  # Requests of missing chunks are answered from there
+                if callback is not None:
+                    self._callbacks[key] = callback
+                self._update(FragmentMessage(self._message_id, self._ID, len(chunks), len(chunks), 0, b"", self._BIT))
+                threading.Thread(target=self._send_fragments, args=(self._message_id, chunks), daemon=True).start()
+                if self._VERBOSE:
+                    print(f"[{self._ID}] Initiating fragmented flood {key}: {len(chunks)} chunks")
+                return
+
+            msg = BroadcastMessage(
+                id=self._message_id,
+                sender=self._ID,
+                size=len(data_byte),
+                data=data_byte,
+                viewers=self._BIT
+            )
+
+            if callback is not None:
+                self._callbacks[(self._ID, msg.id)] = callback
+            self._update(msg)
+
+        if self._VERBOSE:
+            print(f"[{self._ID}] Initiating flood: {msg}")
+
+
+    def _send_fragments(self, message_id, chunks):
         """
+        Flood each chunk in turn, waiting while an outbound queue holds window frames
 
-        data_byte = data.encode('utf-8')
-        self.ready = False
-        self.data.append([time.time(), self.ready])
-        self._message_id += 1
+        Chunks are forwarded by each RPi once, as soon as they are received: a RPi relays chunk k while chunk k+1
+        arrives, and the links are never held by the whole message. The end marker, flooded by broadcast before the
+        chunks, gives their count to every RPi: a RPi missing chunks requests them from a neighbor (see _recover),
+        and adds itself to the viewers of the marker once it has reassembled the message (completion).
+        """
 
-        msg = BroadcastMessage(
-            id=self._message_id ,
-            sender=self._ID,
-            size=len(data_byte),
-            data=data_byte,
-            viewers={self._ID}
-        )
+        for chunk, data in enumerate(chunks):
+            deadline = time.time() + FRAGMENT_TIMEOUT
+            while self._congested() and time.time() < deadline:
+                time.sleep(FRAGMENT_POLL)
 
-        self._last_viewers = {self._ID}
-        self._flood(msg)  # Send message to all neighbors
+            with self._lock:
+                self._update(FragmentMessage(message_id, self._ID, chunk, len(chunks), len(data), data, self._BIT))
 
-        self._rocky.leds(0, 1, 0)  # Yellow
 
-        if self._VERBOSE:
-            print(f"[{self._ID}] Initiating flood: {msg}")
+    def _congested(self):
+        return any(queue['depth'] >= self._WINDOW for queue in self._bluetooth.queue_stats().values())
+
+
+    def missing(self, origin, message_id):
+        """
+        Return the indices of the chunks not yet received of the fragmented broadcast (origin, message_id),
+        None if it is not being reassembled (not seen, already complete or forgotten)
+        """
+
+        with self._lock:
+            key = (origin, message_id)
+            if key not in self._recovery or key not in self._fragments:
+                return None
+            return [i for i, chunk in enumerate(self._fragments[key]) if chunk is None]
+
+
+    def relay_stats(self):
+        """
+        Return {'transmissions', 'delivered'} of this RPi
+
+        The transmissions per delivered broadcast of the swarm are the sum of transmissions over the sum of delivered.
+        """
+
+        return {'transmissions': self.transmissions, 'delivered': self.delivered}
+
+
+    def in_flight(self):
+        """
+        Return the (origin, id) of the floods seen by this RPi that have not reached every agent yet
+        """
+
+        with self._lock:
+            return set(self._in_flight)
+
+
+    def _leds(self, red, yellow, green):
+        """
+        Set the leds of the Balboa, if any (rocky is None for virtual nodes, see launcher.py)
+        """
+        if self._rocky is not None:
+            self._rocky.leds(red, yellow, green)
 
 
     def listen(self, mode=True):
@@ -78,85 +299,350 @@ class Flooding:
             self._listening = False
 
 
-    def _get_buffer(self):
+    def _on_message(self, index, message):
+        """
+        Keep each received message for the listening thread (called by the receiving thread, must not block)
+        """
+
+        with self._arrived:
+            self._inbox.append((index, message))
+            self._arrived.notify()
+
+
+    def _receive(self):
+        """
+        Return (index, message) of the next broadcast message, chunk or chunk request received from RPi index, None if
+        there is none within LISTEN_TIMEOUT seconds
+
+        Each received message is handed once, in order of arrival, without polling and without loss (unbounded inbox).
+        """
+
+        with self._arrived:
+            if not self._arrived.wait_for(lambda: self._inbox, LISTEN_TIMEOUT):
+                return None
+            index, payload = self._inbox.popleft()
+        self.sequence += 1
+
+        schema, values = decode(payload)
+        if schema is FRAGMENT_SCHEMA:
+            return index, FragmentMessage(*values)
+        if schema is FRAGMENT_REQUEST_SCHEMA:
+            return index, FragmentRequest(*values)
+        if schema is not BROADCAST_SCHEMA:
+            return None
 
-        for i in range(len(self.buffer)):
-            if self._bluetooth.buffer[self._PROCESS][i] != -1:
-                packed = self._bluetooth.buffer[self._PROCESS][i]
-                id = struct.unpack('H', packed[:2])[0]
-                sender = struct.unpack('B', packed[2:3])[0]
-                size = struct.unpack('H', packed[3:5])[0]
-                data = struct.unpack(f'{size}s', packed[5:5 + size])[0]
-                viewers = set(struct.unpack(f'{(len(packed[5 + size:]))}B', packed[5 + size:]))
-                self.buffer[i] = BroadcastMessage(id, sender, size, data, viewers)
+        self.buffer[index] = BroadcastMessage(*values)
+        self.last_message = self.buffer[index]
+        return index, self.last_message
 
 
     def _listen_loop(self):
 
         while self._listening:
 
-            message = None
-            while message is None:
-                last_buffer = deepcopy(self.buffer)
-                self._get_buffer()
-                for i in range(len(self.buffer)):
-                    if last_buffer[i] != self.buffer[i]:
-                        message = self.buffer[i]
-                        self.last_message = message
-                        break
-
-            if self._ID not in message.viewers and self.ready:  # Receive new message
-
-                if message.viewers | {self._ID} == self._all_rpis_id:
-                    if self._VERBOSE:
-                        print(f"[{self._ID}] All nodes reached! Turning GREEN")
-                    self._rocky.leds(0, 0, 1)
-                    self.ready = True
+            received = self._receive()
+            with self._lock:
+                self._recover()
+            if received is None:
+                continue
+
+            index, message = received
+            with self._lock:
+                if isinstance(message, FragmentRequest):
+                    self._answer(message, index)
                 else:
-                    self._rocky.leds(0, 1, 0)  # Yellow
-                    self.ready = False
+                    self._update(message, index)
 
-                self._flood(message._replace(viewers=message.viewers | {self._ID}))
-                self._last_viewers = message.viewers | {self._ID}
-                self._message_id = message.id
+            time.sleep(self._DELAY)
 
 
-            elif self._message_id == message.id and not self.ready:
+    def _update(self, message, index=None):
+        """
+        Merge the viewers of message, received from RPi index (None if initiated here), into its flood (keyed by
+        (origin, id)) and forward it according to the relay strategy
 
-                if message.viewers == self._all_rpis_id:
-                    if self._VERBOSE:
-                        print(f"[{self._ID}] All nodes reached! Turning GREEN")
-                    self._rocky.leds(0, 0, 1)
-                    self.ready = True
-                    self._flood(message)
+        A flood seen for the first time is forwarded with this RPi added to its viewers, a flood whose viewers did not
+        change is a duplicate and is dropped. The flood is completed when its viewers are the whole swarm.
+        A RPi only adds itself to the viewers of the end marker of a fragmented broadcast once it has every chunk.
+        """
 
-                elif message.viewers != self._last_viewers:  # Viewers changed
+        key = self._key(message)
+        marker = isinstance(message, FragmentMessage) and message.chunk == message.count
+        known = self._floods.pop(key, 0)
+        viewers = known | message.viewers | (self._BIT if not marker or self._assembled(key) else 0)
+        if key in self._copies:
+            self._copies[key] += 1
+        reassembled = False
+        if not known and index is not None:
+            if marker:
+                self._expect(message)
+            else:
+                self.delivered += 1
+                if isinstance(message, FragmentMessage):
+                    reassembled = self._reassemble(message)
+
+        self._floods[key] = viewers  # Most recently seen
+        while len(self._floods) > self._CACHE_SIZE:
+            forgotten, _ = self._floods.popitem(last=False)
+            self._in_flight.discard(forgotten)
+            self._retransmitted.discard(forgotten)
+            self._callbacks.pop(forgotten, None)
+
+        if self._RELAY != 'flood' or viewers != known:
+            self._relay(message._replace(viewers=viewers), index, first=not known)
+
+        if isinstance(message, FragmentMessage) and not marker:
+            if reassembled:
+                self._update(message._replace(chunk=message.count, size=0, data=b"", viewers=self._BIT))
+            return  # Completion is known from the end marker
+        if viewers == known:
+            return  # Duplicate
+
+        if viewers == self._all_rpis_id:
+            self._in_flight.discard(key)
+            if self._VERBOSE:
+                print(f"[{self._ID}] All nodes reached by flood {key}")
+            self._completed(message._replace(viewers=viewers))
+        else:
+            self._in_flight.add(key)
 
-                    self._last_viewers = message.viewers | self._last_viewers
+        self.ready = not self._in_flight
+        if self.ready:
+            if self._VERBOSE:
+                print(f"[{self._ID}] No flood in flight! Turning GREEN")
+            self._leds(0, 0, 1)
+        else:
+            self._leds(0, 1, 0)  # Yellow
+        self.data.append([time.time(), self.ready])
 
-                    if message.viewers | self._last_viewers == self._all_rpis_id:
-                        if self._VERBOSE:
-                            print(f"[{self._ID}] All nodes reached! Turning GREEN")
-                        self._rocky.leds(0, 0, 1)
-                        self.ready = True
 
-                    self._flood(message._replace(viewers=self._last_viewers))
-                    self.ready = False
+    def _key(self, message):
+        """
+        Return the key of the flood of message: (origin, id), or (origin, id, chunk) for a chunk (the end marker of a
+        fragmented broadcast is keyed (origin, id), as the broadcast itself)
+        """
 
-            self.data.append([time.time(), self.ready])
+        if isinstance(message, FragmentMessage) and message.chunk < message.count:
+            return message.sender, message.id, message.chunk
+        return message.sender, message.id
 
-            time.sleep(self._DELAY)
 
+    def _assembled(self, key):
+        """
+        Return True if this RPi has every chunk of the fragmented broadcast key (origin, id)
+        """
+
+        return key in self._fragments and key not in self._recovery
+
+
+    def _expect(self, marker):
+        """
+        Start the reassembly of a fragmented broadcast announced by its end marker, before any of its chunks
+        """
+
+        key = (marker.sender, marker.id)
+        if key not in self._fragments:
+            self._store(key, [None] * marker.count)
+            self._recovery[key] = [time.time(), (), None]
+
+
+    def _store(self, key, chunks):
+        """
+        Keep the chunks of a fragmented broadcast, also once reassembled to answer the requests of the neighbors
+        """
+
+        self._fragments.pop(key, None)
+        self._fragments[key] = chunks  # Most recently seen
+        while len(self._fragments) > self._CACHE_SIZE:
+            forgotten, _ = self._fragments.popitem(last=False)
+            self._recovery.pop(forgotten, None)
+
+
+    def _reassemble(self, message):
+        """
+        Store a chunk received for the first time, the whole message becomes self.last_message once every chunk is
+        there. Return True if the message has just been reassembled.
+        """
+
+        key = (message.sender, message.id)
+        if self._assembled(key):
+            return False  # Chunk already received, then forgotten by the cache of floods
+
+        chunks = self._fragments.get(key) or [None] * message.count
+        chunks[message.chunk] = message.data
+        self._store(key, chunks)
+
+        if any(chunk is None for chunk in chunks):
+            self._recovery[key] = [time.time(), *self._recovery.get(key, [0, (), None])[1:]]
+            return False
+
+        self._recovery.pop(key, None)
+        data = b"".join(chunks)
+        self.last_message = BroadcastMessage(message.id, message.sender, len(data), data, message.viewers)
+        if self._VERBOSE:
+            print(f"[{self._ID}] Fragmented flood {key} reassembled: {len(data)} bytes")
+        return True
+
+
+    def _recover(self):
+        """
+        Request the missing chunks of the fragmented broadcasts being reassembled, window at a time from one neighbor
+
+        The next request is sent as soon as the requested chunks arrived, or after FRAGMENT_TIMEOUT seconds without
+        any chunk. Neighbors are asked from the closest to the origin, which has every chunk: the next one is asked
+        when a request was not answered.
+        """
+
+        now = time.time()
+        for key, (last, requested, neighbor) in list(self._recovery.items()):
+            chunks = self._fragments.get(key)
+            if chunks is None:
+                del self._recovery[key]
+                continue
+
+            timeout = now - last > FRAGMENT_TIMEOUT
+            if not timeout and (not requested or any(chunks[i] is None for i in requested)):
+                continue
+
+            distances = hops(self._bluetooth.ADJACENCY, key[0])
+            neighbors = sorted([n for n in self._bluetooth.neighbors_index if self._bluetooth.connected(n)],
+                               key=lambda n: (distances[n], n))
+            if not neighbors:
+                continue
+            if neighbor not in neighbors:
+                neighbor = neighbors[0]
+            elif requested and timeout:
+                neighbor = neighbors[(neighbors.index(neighbor) + 1) % len(neighbors)]
+
+            missing = tuple(i for i, chunk in enumerate(chunks) if chunk is None)[:self._WINDOW]
+            self._recovery[key] = [now, missing, neighbor]
+            self.transmissions += 1
+            request = FRAGMENT_REQUEST_SCHEMA.pack(self._PROCESS, key[1], key[0], len(missing), missing)
+            self._send(request, [neighbor])
+            if self._VERBOSE:
+                print(f"[{self._ID}] Requested chunks {missing} of {key} from {neighbor}")
+
+
+    def _answer(self, request, index):
+        """
+        Send to RPi index the chunks it requested that this RPi has
+        """
+
+        chunks = self._fragments.get((request.sender, request.id))
+        if chunks is None:
+            return
+
+        for chunk in request.chunks:
+            if chunk < len(chunks) and chunks[chunk] is not None:
+                viewers = self._floods.get((request.sender, request.id, chunk), self._BIT)
+                self._flood(FragmentMessage(request.id, request.sender, chunk, len(chunks), len(chunks[chunk]),
+                                            chunks[chunk], viewers), [index])
+
+
+    def _completed(self, message):
+        """
+        Call the callback of a flood of this RPi that reached every agent (its end marker if fragmented)
+        """
+
+        key = (message.sender, message.id)
+        if isinstance(message, FragmentMessage):
+            message = BroadcastMessage(message.id, message.sender, 0, b"", message.viewers)
+
+        callback = self._callbacks.pop(key, None)
+        if callback is not None:
+            try:
+                callback(message)
+            except Exception as e:
+                print(f"Flood callback error: {e}")
+
+
+    def _relay(self, message, index, first):
+        """
+        Forward message, received from RPi index (None if initiated here), according to the relay strategy
+        first: this copy is the first one of its flood received by this RPi
+
+        Except with 'flood', a flood is forwarded at most once: with 'mpr', on the first copy coming from an MPR
+        selector (whichever copy came first), with 'gossip' and 'counter', as decided on its first copy.
+        Chunks of fragmented broadcasts are also forwarded once with 'flood', to the neighbors not in their viewers.
+        """
+
+        if self._RELAY == 'flood':
+            if self._key(message) == (message.sender, message.id):
+                self._flood(message)
+            elif first:
+                self._flood(message, self._unreached(message.viewers))
+            return
+
+        key = self._key(message)
+        if key in self._retransmitted:
+            return
+        if index is None or (self._RELAY == 'mpr' and index in self._SELECTORS) or \
+                (self._RELAY == 'gossip' and first and random.random() < self._PROBABILITY):
+            self._retransmitted.add(key)
+            self._flood(message, self._unreached(message.viewers))
+        elif first and self._RELAY in ('gossip', 'counter'):
+            self._retransmitted.add(key)  # Decided on the first copy (forwarded after the delay with 'counter')
+            if self._RELAY == 'counter':
+                self._copies[key] = 1
+                threading.Timer(random.uniform(0, self._ASSESSMENT_DELAY), self._assess, (key, message)).start()
+
+
+    def _assess(self, key, message):
+        """
+        Forward message at the end of its assessment delay if it has been received less than threshold times
+        """
+
+        with self._lock:
+            if self._copies.pop(key, self._THRESHOLD) < self._THRESHOLD:
+                viewers = self._floods.get(key, message.viewers)
+                self._flood(message._replace(viewers=viewers), self._unreached(viewers))
+
+
+    def _unreached(self, viewers):
+        return [n for n in self._bluetooth.neighbors_index if not viewers & (1 << n) and self._bluetooth.connected(n)]
+
+
+    def _check_drops(self):
+        """
+        Report the messages of this process dropped since the last check (outbound queues or disconnected neighbors)
+        """
+
+        dropped = self._bluetooth.process_stats(self._PROCESS).dropped
+        if dropped > self.dropped:
+            print(f"[{self._ID}] {dropped - self.dropped} messages dropped (outbound queues, see send_policy, or lost links)")
+            self.dropped = dropped
+
+
+    def _send(self, payload, dest):
+        """
+        Send payload to dest (list of neighbors IDs, every neighbor if None)
+
+        A neighbor disconnected meanwhile (links come and go, see retry_min) counts as a drop of the process instead of
+        stopping the listening thread.
+        """
+
+        if dest is not None:
+            connected = [n for n in dest if self._bluetooth.connected(n)]
+            self._bluetooth.process_stats(self._PROCESS).dropped += len(dest) - len(connected)
+            dest = connected
+        if dest is None or dest:
+            try:
+                self._bluetooth.send_bytes(payload, dest)
+            except TypeError:  # Disconnected between the check and the send
+                self._bluetooth.process_stats(self._PROCESS).dropped += len(dest)
+        self._check_drops()
+
+
+    def _flood(self, msg: BroadcastMessage, dest=None):
+        """
+        Send msg to dest (list of neighbors IDs), to every neighbor if dest is None
+        """
 
-    def _flood(self, msg: BroadcastMessage):
+        if dest is not None and not dest:
+            return
 
-        msg_type = f'<BHBH{len(msg.data)}s{len(msg.viewers)}B'
-        self._bluetooth.send_message(msg_type,
-                                     self._PROCESS,
-                                     msg.id,
-                                     msg.sender,
-                                     msg.size,
-                                     msg.data,
-                                     *msg.viewers)
+        schema = FRAGMENT_SCHEMA if isinstance(msg, FragmentMessage) else BROADCAST_SCHEMA
+        self.transmissions += len(self._bluetooth.neighbors_index) if dest is None else len(dest)
+        self._send(schema.pack(self._PROCESS, *msg, self._WIDTH), dest)
         if self._VERBOSE:
             print(f"[{self._ID}] Sent to neighbors")
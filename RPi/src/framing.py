@@ -0,0 +1,170 @@
+"""
+* Master's Thesis *
+Implementation of a robotic swarm platform
+based on the Balboa self-balancing robot
+© 2025 Romain Englebert
+"""
+
+
+import struct
+import zlib
+
+
+# Frame structure: [length (uint32), flags (uchar), payload (length bytes), CRC32 (uint32, optional)]
+HEADER = struct.Struct('<IB')
+CRC = struct.Struct('<I')
+
+# Flags
+FLAG_CRC = 0x01  # A CRC32 of the payload follows the payload
+FLAG_CONTROL = 0x02  # Payload is a control message of Bluetooth, it is not delivered to processes
+FLAG_BATCH = 0x04  # Payload contains several messages: [length (ushort), message] * n
+FLAG_TIMESTAMP = 0x08  # Payload starts with its send time (double), used for latency telemetry
+
+# Control messages: [type (uchar), arguments]
+HELLO = struct.Struct('<BH')  # [HELLO_TYPE, ID]: first frame of a connector when the transport does not identify peers
+HELLO_TYPE = 1
+# [HEARTBEAT_TYPE, send time, echoed send time, hold time]: keeps the link alive when no message is sent
+# The last heartbeat received is echoed with the time it has been held, so that the sender measures the round trip.
+HEARTBEAT = struct.Struct('<Bddd')
+HEARTBEAT_TYPE = 2
+READY = struct.Struct('<B')  # [READY_TYPE]: sent on each new connection in rendezvous mode, once able to receive
+READY_TYPE = 3
+
+BATCH_LENGTH = struct.Struct('<H')
+TIMESTAMP = struct.Struct('<d')
+
+MAX_PAYLOAD = 1 << 20  # Anything bigger is considered as a corrupted header
+
+
+def encode_frame(payload, checksum=False, flags=0, timestamp=None):
+    """
+    Return payload wrapped in a frame
+
+    payload: bytes to be sent
+    checksum: bool for appending a CRC32 of the payload
+    flags: additional flags stored in the header
+    timestamp: optional send time placed before the payload (FLAG_TIMESTAMP)
+    """
+
+    if timestamp is not None:
+        flags |= FLAG_TIMESTAMP
+        payload = TIMESTAMP.pack(timestamp) + payload
+    if checksum:
+        flags |= FLAG_CRC
+        return HEADER.pack(len(payload), flags) + payload + CRC.pack(zlib.crc32(payload))
+    return HEADER.pack(len(payload), flags) + payload
+
+
+def encode_batch(payloads, checksum=False, timestamp=None):
+    """
+    Return one frame containing all payloads (each payload must be shorter than 65536 bytes)
+    """
+
+    batch = bytearray()
+    for payload in payloads:
+        batch += BATCH_LENGTH.pack(len(payload))
+        batch += payload
+    return encode_frame(bytes(batch), checksum, FLAG_BATCH, timestamp)
+
+
+def split_batch(payload):
+    """
+    Generator of the messages of a batch frame payload
+    """
+
+    offset = 0
+    while offset + BATCH_LENGTH.size <= len(payload):
+        length = BATCH_LENGTH.unpack_from(payload, offset)[0]
+        offset += BATCH_LENGTH.size
+        yield payload[offset:offset + length]
+        offset += length
+
+
+class FrameError(Exception):
+    pass
+
+
+class FrameParser:
+    """
+    Incremental parser of a byte stream into frames
+
+    RFCOMM is a stream: one recv() can contain several messages, or only a part of one.
+    Received chunks are appended to a reusable buffer with feed(), complete frames are then extracted from it.
+    """
+
+    def __init__(self, size=4096):
+        self._buffer = bytearray(size)
+        self._start = 0  # First unread byte
+        self._end = 0  # First free byte
+
+        self.errors = 0  # Number of dropped frames (CRC mismatch)
+
+
+    def recv_into(self, conn):
+        """
+        Read directly from conn into the free part of the buffer and return the number of bytes read
+        """
+
+        self._reserve(4096)
+        n = conn.recv_into(memoryview(self._buffer)[self._end:])
+        self._end += n
+        return n
+
+
+    def feed(self, data):
+        """
+        Append data (bytes) to the buffer
+        """
+
+        self._reserve(len(data))
+        self._buffer[self._end:self._end + len(data)] = data
+        self._end += len(data)
+
+
+    def frames(self):
+        """
+        Generator of (flags, payload) for each complete frame in the buffer
+        Incomplete frames are kept in the buffer until the next feed()
+        """
+
+        while self._end - self._start >= HEADER.size:
+            length, flags = HEADER.unpack_from(self._buffer, self._start)
+            if length > MAX_PAYLOAD:
+                self._start = self._end = 0
+                raise FrameError(f"Frame length {length} exceeds {MAX_PAYLOAD} bytes, stream is desynchronized")
+
+            size = HEADER.size + length + (CRC.size if flags & FLAG_CRC else 0)
+            if self._end - self._start < size:
+                break
+
+            begin = self._start + HEADER.size
+            payload = bytes(self._buffer[begin:begin + length])
+            self._start += size
+
+            if flags & FLAG_CRC:
+                if CRC.unpack_from(self._buffer, begin + length)[0] != zlib.crc32(payload):
+                    self.errors += 1
+                    continue
+
+            yield flags, payload
+
+        # Rewind when everything has been read, avoid the buffer growing
+        if self._start == self._end:
+            self._start = self._end = 0
+
+
+    def _reserve(self, n):
+        """
+        Ensure at least n free bytes at the end of the buffer by compacting then growing it
+        """
+
+        if len(self._buffer) - self._end >= n:
+            return
+
+        pending = self._end - self._start
+        if self._start > 0:
+            self._buffer[:pending] = self._buffer[self._start:self._end]
+            self._start, self._end = 0, pending
+
+        if len(self._buffer) - self._end < n:
+            self._buffer.extend(bytes(max(n, len(self._buffer))))
@@ -0,0 +1,134 @@
+"""
+* Master's Thesis *
+Implementation of a robotic swarm platform
+based on the Balboa self-balancing robot
+© 2025 Romain Englebert
+"""
+
+
+import multiprocessing
+import random
+import tempfile
+import threading
+from bluetooth import Bluetooth
+from transport import TCPTransport, UnixTransport, tcp_addresses, unix_addresses
+
+
+# ---------- Adjacency matrices -----------
+
+def line(n):
+    return [[int(abs(i - j) <= 1) for j in range(n)] for i in range(n)]
+
+
+def ring(n):
+    return [[int(abs(i - j) <= 1 or abs(i - j) == n - 1) for j in range(n)] for i in range(n)]
+
+
+def complete(n):
+    return [[1] * n for _ in range(n)]
+
+
+def random_graph(n, p, seed=None):
+    """
+    Connected random graph: a random spanning tree, then each other edge with probability p
+    """
+
+    rng = random.Random(seed)
+    adjacency = [[int(i == j) for j in range(n)] for i in range(n)]
+    for i in range(1, n):
+        j = rng.randrange(i)
+        adjacency[i][j] = adjacency[j][i] = 1
+    for i in range(n):
+        for j in range(i + 1, n):
+            if rng.random() < p:
+                adjacency[i][j] = adjacency[j][i] = 1
+    return adjacency
+
+
+# ---------- Virtual swarm -----------
+
+def virtual_swarm(adjacency, transport='unix', base_port=47000, directory=None):
+    """
+    Return (transport, addresses) used instead of RPIS_MACS to run len(adjacency) nodes on the same computer
+
+    transport: 'unix' (AF_UNIX sockets in directory) or 'tcp' (localhost, from base_port)
+    """
+
+    n = len(adjacency)
+    if transport == 'unix':
+        if directory is None:
+            directory = tempfile.mkdtemp(prefix='balboa_')
+        return UnixTransport(), unix_addresses(n, directory)
+    if transport == 'tcp':
+        return TCPTransport(), tcp_addresses(n, base_port=base_port)
+
+    print("transport must be 'unix' or 'tcp'")
+    raise Exception
+
+
+def _node(id, addresses, adjacency, transport, target, bt_kwargs, barrier, results=None):
+    """
+    Run one virtual node: start its network, wait for every node to be connected and call target(bluetooth)
+    """
+
+    bluetooth = Bluetooth(id, addresses, adjacency, transport=transport, **bt_kwargs)
+    bluetooth.start_network()
+    barrier.wait()
+    result = target(bluetooth)
+    if results is not None:
+        results.put((id, result))
+    return result
+
+
+def launch(adjacency, target, mode='threads', transport='unix', base_port=47000, **bt_kwargs):
+    """
+    Start one node per row of adjacency and return the list of target(bluetooth) results, indexed by ID
+    target is called on every node at the same time, once the whole swarm is connected.
+
+    target(bluetooth): function run by each node once its network is up (the application, e.g. a benchmark)
+    mode: 'threads' (every node in this process) or 'processes' (one process per node, no shared GIL)
+    transport: 'unix' or 'tcp' (see virtual_swarm)
+    base_port: first port with transport='tcp' (servers of previous swarms of this process are still listening)
+    bt_kwargs: other arguments of Bluetooth (processes, engine, verbose, ...)
+
+    Note: with mode='processes', target has to be defined at module level to be sent to the child processes.
+    """
+
+    bt_kwargs.setdefault('verbose', False)
+    transport, addresses = virtual_swarm(adjacency, transport, base_port)
+    n = len(adjacency)
+
+    if mode == 'threads':
+        barrier = threading.Barrier(n)
+        results = [None] * n
+
+        def run(id):
+            results[id] = _node(id, addresses, adjacency, transport, target, bt_kwargs, barrier)
+
+        threads = [threading.Thread(target=run, args=(id,), daemon=True) for id in range(n)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    if mode == 'processes':
+        queue = multiprocessing.Queue()
+        barrier = multiprocessing.Barrier(n)
+        processes = [multiprocessing.Process(target=_node,
+                                             args=(id, addresses, adjacency, transport, target, bt_kwargs, barrier, queue),
+                                             daemon=True)
+                     for id in range(n)]
+        for process in processes:
+            process.start()
+
+        results = [None] * n
+        for _ in range(n):
+            id, result = queue.get()
+            results[id] = result
+        for process in processes:
+            process.join()
+        return results
+
+    print("mode must be 'threads' or 'processes'")
+    raise Exception
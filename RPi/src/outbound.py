@@ -0,0 +1,136 @@
+"""
+* Master's Thesis *
+Implementation of a robotic swarm platform
+based on the Balboa self-balancing robot
+© 2025 Romain Englebert
+"""
+
+
+import threading
+from collections import deque
+
+
+POLICIES = ('drop_oldest', 'drop_newest', 'block')
+
+
+class OutboundQueue:
+    """
+    Bounded queue of messages (flags, payload) waiting to be framed and written on one connection
+
+    Filled by send_message (any thread) and drained by the writer of the connection, so that a slow or
+    half-dead neighbor only delays its own traffic.
+
+    Policies when the queue is full:
+        - 'drop_oldest': the oldest queued message is dropped (the most recent state is always sent)
+        - 'drop_newest': the new message is dropped
+        - 'block': the sender waits up to timeout seconds for some room (backpressure), then drops the new message
+
+    on_drop(message) is optionally called with each dropped message (under the lock of the queue: it must be short).
+    """
+
+    def __init__(self, size=64, policy='drop_oldest', timeout=1.0, on_drop=None):
+
+        if policy not in POLICIES:
+            print(f"policy must be one of {POLICIES}")
+            raise Exception
+
+        self._messages = deque()
+        self._condition = threading.Condition()
+        self._closed = False
+
+        self._SIZE = size
+        self._POLICY = policy
+        self._TIMEOUT = timeout
+        self._on_drop = on_drop
+
+        # Metrics
+        self.sent = 0
+        self.dropped = 0
+        self.max_depth = 0
+
+
+    def put(self, message):
+        """
+        Queue message, return False if it has been dropped
+        """
+
+        with self._condition:
+            if self._closed:
+                self._drop(message)
+                return False
+
+            if len(self._messages) >= self._SIZE:
+                if self._POLICY == 'drop_oldest':
+                    self._drop(self._messages.popleft())
+                elif self._POLICY == 'drop_newest' or \
+                        not self._condition.wait_for(lambda: len(self._messages) < self._SIZE or self._closed, self._TIMEOUT) \
+                        or self._closed:
+                    self._drop(message)
+                    return False
+
+            self._messages.append(message)
+            self.max_depth = max(self.max_depth, len(self._messages))
+            self._condition.notify_all()
+            return True
+
+
+    def _drop(self, message):
+        self.dropped += 1
+        if self._on_drop is not None:
+            self._on_drop(message)
+
+
+    def get(self, timeout=None):
+        """
+        Return the oldest message, waiting for one if the queue is empty (None if closed or after timeout seconds)
+        """
+
+        with self._condition:
+            self._condition.wait_for(lambda: self._messages or self._closed, timeout)
+            return self._pop()
+
+
+    def get_nowait(self):
+        with self._condition:
+            return self._pop()
+
+
+    def get_all(self):
+        """
+        Return the list of all queued messages, without waiting
+        """
+
+        with self._condition:
+            messages = []
+            while self._messages:
+                messages.append(self._pop())
+            return messages
+
+
+    def _pop(self):
+        if not self._messages:
+            return None
+        message = self._messages.popleft()
+        self.sent += 1
+        self._condition.notify_all()  # Room for blocked senders
+        return message
+
+
+    def close(self):
+        """
+        Drop queued messages and wake up the writer and blocked senders
+        """
+
+        with self._condition:
+            self._closed = True
+            while self._messages:
+                self._drop(self._messages.popleft())
+            self._condition.notify_all()
+
+
+    def depth(self):
+        return len(self._messages)
+
+
+    def stats(self):
+        return {'depth': len(self._messages), 'max_depth': self.max_depth, 'sent': self.sent, 'dropped': self.dropped}
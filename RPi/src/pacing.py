@@ -0,0 +1,68 @@
+"""
+* Master's Thesis *
+Implementation of a robotic swarm platform
+based on the Balboa self-balancing robot
+© 2025 Romain Englebert
+"""
+
+
+from collections import deque
+
+
+SMOOTHING = 0.1  # Weight of a new sample in the round time average
+
+
+class AdaptivePacing:
+    """
+    Inter-round delay of Sync adapted online (gentle decrease, multiplicative increase)
+
+    After each round, Sync reports the time the round took, the round trip time of its links (if measured by
+    heartbeats) and whether the round was congested: a frame was dropped or an outbound queue holds more than
+    queue_limit frames (neighbors missing the deadline do not count, they may just pace with a longer delay).
+        - Congested rounds over the last window rounds above target: the delay is doubled (at least step)
+        - Round not congested: the delay decreases by an eighth, at least by a tenth of the round trip time
+          (or of the round time when it is not measured)
+    The delay then settles at the smallest value that keeps congested rounds under target. It starts at min_delay.
+    """
+
+    def __init__(self, min_delay=0.0, max_delay=2.0, target=0.05, window=20, queue_limit=4):
+        """
+        min_delay, max_delay: bounds of the delay (s)
+        target: accepted fraction of congested rounds
+        window: number of last rounds over which the fraction is computed
+        queue_limit: depth of an outbound queue from which the round is considered congested
+        """
+
+        self.MIN_DELAY = min_delay
+        self.MAX_DELAY = max_delay
+        self.TARGET = target
+        self.QUEUE_LIMIT = queue_limit
+
+        self._congested = deque(maxlen=window)
+
+        self.delay = min_delay  # Current delay (s)
+        self.round_time = None  # Average time of a round without delay (s)
+
+
+    def update(self, round_time, rtt, congested):
+        """
+        Return the delay after a round of round_time seconds, rtt being None when not measured
+        """
+
+        self.round_time = round_time if self.round_time is None else self.round_time + SMOOTHING * (round_time - self.round_time)
+        self._congested.append(congested)
+        step = 0.1 * (rtt if rtt is not None else self.round_time)
+
+        if congested and sum(self._congested) > self.TARGET * len(self._congested):
+            self.delay = min(self.MAX_DELAY, max(2 * self.delay, step))
+        elif not congested:
+            self.delay = max(self.MIN_DELAY, self.delay - max(step, self.delay / 8))
+        return self.delay
+
+
+    def congestion(self):
+        """
+        Return the fraction of congested rounds over the last rounds
+        """
+
+        return sum(self._congested) / len(self._congested) if self._congested else 0.0
@@ -0,0 +1,82 @@
+"""
+* Master's Thesis *
+Implementation of a robotic swarm platform
+based on the Balboa self-balancing robot
+© 2025 Romain Englebert
+"""
+
+
+import time
+import numpy as np
+
+
+class RoundProfiler:
+    """
+    Time spent in each phase of the rounds of a communication process (Sync, Async), with the bytes sent and received
+
+    Rounds are recorded into a preallocated array of size rows (the oldest rounds are overwritten beyond), one column
+    per phase: [start time, phase durations (s), bytes sent, bytes received].
+    Usage for each round: start(), mark(phase) at the end of each phase, end(bytes sent, bytes received).
+    The time since the previous mark is added to phase, a phase can then be marked several times in a round.
+    """
+
+    def __init__(self, phases, size=10000):
+        self.PHASES = list(phases)
+        self.COLUMNS = ['start', *self.PHASES, 'bytes_sent', 'bytes_received']
+
+        self._columns = {column: i for i, column in enumerate(self.COLUMNS)}
+        self._rows = np.zeros((size, len(self.COLUMNS)))
+        self._row = None  # Row of the current round
+        self._last = 0.0  # Time of the last mark
+
+        self.rounds = 0  # Number of recorded rounds
+
+
+    def start(self):
+        self._row = self._rows[self.rounds % len(self._rows)]
+        self._row[:] = 0
+        self._row[0] = time.time()
+        self._last = time.perf_counter()
+
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self._row[self._columns[phase]] += now - self._last
+        self._last = now
+
+
+    def end(self, bytes_sent=0, bytes_received=0):
+        self._row[-2] = bytes_sent
+        self._row[-1] = bytes_received
+        self.rounds += 1
+
+
+    def rows(self):
+        """
+        Return a copy of the recorded rounds, oldest first (columns: self.COLUMNS)
+        """
+
+        size = len(self._rows)
+        if self.rounds <= size:
+            return self._rows[:self.rounds].copy()
+        return np.roll(self._rows, -(self.rounds % size), axis=0)
+
+
+    def summary(self):
+        """
+        Return {column: {'p50', 'p95', 'max'}} of each phase and byte count over the recorded rounds
+        """
+
+        rows = self.rows()
+        if len(rows) == 0:
+            return {}
+
+        p50, p95, maximum = np.percentile(rows[:, 1:], 50, axis=0), np.percentile(rows[:, 1:], 95, axis=0), rows[:, 1:].max(axis=0)
+        return {column: {'p50': float(p50[i]), 'p95': float(p95[i]), 'max': float(maximum[i])}
+                for i, column in enumerate(self.COLUMNS[1:])}
+
+
+    def print_summary(self):
+        print(f"{self.rounds} rounds:")
+        for column, values in self.summary().items():
+            print(f"    {column}: p50 {values['p50']:.4g}, p95 {values['p95']:.4g}, max {values['max']:.4g}")
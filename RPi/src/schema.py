@@ -0,0 +1,122 @@
+"""
+* Master's Thesis *
+Implementation of a robotic swarm platform
+based on the Balboa self-balancing robot
+© 2025 Romain Englebert
+"""
+
+
+import struct
+
+
+# Type ids of the messages of each protocol layer, carried on the wire right after the process id
+SYNC = 1
+ASYNC = 2
+BROADCAST = 3
+UNICAST = 4
+FRAGMENT = 5
+FRAGMENT_REQUEST = 6
+
+
+class MessageSchema:
+    """
+    Message type declared once and compiled: [type id (uchar), fixed part (struct), variable-length tail]
+
+    The fixed part is a struct.Struct compiled at declaration, decoded with unpack_from on a memoryview of the
+    received message (no slicing copies). The tail is optional and handled by two functions:
+        - encode_tail(*tail_values) returns the bytes of the tail
+        - decode_tail(fixed_values, view) returns the tuple of tail values from a memoryview on the tail
+
+    The process id is only part of packed messages: Bluetooth removes it before placing them into its buffer.
+    """
+
+    def __init__(self, type_id, fmt, encode_tail=None, decode_tail=None):
+        """
+        type_id: uchar identifying the message type (see constants above)
+        fmt: struct format of the fixed part, without byte order (little endian)
+        """
+
+        self.TYPE_ID = type_id
+        self.FORMAT = fmt
+
+        self._packer = struct.Struct(f'<BB{fmt}')  # process id, type id, fixed part
+        self._unpacker = struct.Struct(f'<B{fmt}')  # type id, fixed part
+        self._n_fixed = len(self._unpacker.unpack(bytes(self._unpacker.size))) - 1
+        self._encode_tail = encode_tail
+        self._decode_tail = decode_tail
+
+        self.size = self._unpacker.size  # Size of a received message without tail
+
+
+    def pack(self, process, *values):
+        """
+        Return the bytes to be sent for process: values are the fixed values followed by the tail values
+        """
+
+        packed = self._packer.pack(process, self.TYPE_ID, *values[:self._n_fixed])
+        if self._encode_tail is not None:
+            packed += self._encode_tail(*values[self._n_fixed:])
+        return packed
+
+
+    def unpack(self, message):
+        """
+        Return the tuple of values of a received message (as placed in bluetooth.buffer, without process id)
+        """
+
+        view = memoryview(message)
+        values = self._unpacker.unpack_from(view)
+        if values[0] != self.TYPE_ID:
+            raise SchemaError(f"Message of type {values[0]} decoded as type {self.TYPE_ID}")
+
+        values = values[1:]
+        if self._decode_tail is not None:
+            values += self._decode_tail(values, view[self._unpacker.size:])
+        return values
+
+
+    def matches(self, message):
+        return len(message) >= self.size and message[0] == self.TYPE_ID
+
+
+class SchemaError(Exception):
+    pass
+
+
+# ---------- Registry of fixed message types -----------
+
+_registry = {}
+
+
+def register(schema):
+    """
+    Declare a message type shared by all agents, return it
+    """
+
+    registered = _registry.get(schema.TYPE_ID)
+    if registered is not None and registered.FORMAT != schema.FORMAT:
+        raise SchemaError(f"Type id {schema.TYPE_ID} is already registered with format '{registered.FORMAT}'")
+
+    _registry[schema.TYPE_ID] = schema
+    return schema
+
+
+def lookup(message):
+    """
+    Return the registered schema of a received message, dispatched on its type id (None if unknown)
+    """
+
+    if len(message) < 1:
+        return None
+    return _registry.get(message[0])
+
+
+def decode(message):
+    """
+    Return (schema, values) of a received message of a registered type, (None, None) if unknown
+    """
+
+    schema = lookup(message)
+    if schema is None or len(message) < schema.size:
+        return None, None
+    return schema, schema.unpack(message)
@@ -0,0 +1,324 @@
+"""
+* Master's Thesis *
+Implementation of a robotic swarm platform
+based on the Balboa self-balancing robot
+© 2025 Romain Englebert
+"""
+
+
+import errno
+import selectors
+import socket
+import threading
+import time
+from collections import deque
+from framing import FrameParser, FrameError, FLAG_CONTROL, HELLO, HELLO_TYPE
+
+
+class _Channel:
+    """
+    State of one connection handled by the event loop
+    """
+
+    def __init__(self, sock, mac, index):
+        self.sock = sock
+        self.mac = mac
+        self.index = index
+        self.parser = FrameParser()
+        self.out = bytearray()  # Bytes waiting for the socket to be writable
+        self.queue = None  # OutboundQueue of the connection, filled by send_message
+        self.connecting = False
+
+
+class SelectorEngine:
+    """
+    Single-threaded I/O engine of Bluetooth
+
+    Every socket (server, connections in progress and established connections) is non-blocking and handled
+    by one event loop running in one thread, instead of one thread per connection.
+    Messages sent by other threads are put in the outbound queue of the connection, then the loop is woken up
+    through a wakeup socket. Each connection only takes new frames once its previous bytes are written.
+    """
+
+    def __init__(self, bt):
+        """
+        bt: instance of Bluetooth using this engine
+        """
+
+        self._bluetooth = bt
+        self._selector = selectors.DefaultSelector()
+        self._channels = {}  # mac: _Channel
+        self._pending = deque()  # mac of connections with new frames in their queue
+        self._dials = []  # [time, mac] of next connection attempts
+        self._flushes = {}  # mac: time at which queued messages are written (batch mode)
+        self._wakeup_r, self._wakeup_w = socket.socketpair()
+        self._wakeup_w.setblocking(False)  # A full pipe already means a pending wakeup, senders must not block
+        self._thread = None
+
+
+    def start(self):
+        """
+        Start the event loop thread: listen for neighbors with lower MAC address and connect to those with higher one
+        """
+
+        if self._thread is not None:
+            return
+
+        bt = self._bluetooth
+        self._wakeup_r.setblocking(False)
+        self._selector.register(self._wakeup_r, selectors.EVENT_READ, 'wakeup')
+
+        if any(neighbor < bt._MAC for neighbor in bt.neighbors):
+            server = bt._TRANSPORT.listen(bt._MAC)
+            server.setblocking(False)
+            self._selector.register(server, selectors.EVENT_READ, 'server')
+            print("Server ready to receive connections...")
+
+        for neighbor in bt.neighbors:
+            if neighbor > bt._MAC:
+                self._dials.append([0, neighbor])
+
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+
+    def notify(self, mac):
+        """
+        Frames have been queued for mac, the event loop will write them as soon as the socket is writable
+        Thread safe, returns immediately.
+        """
+
+        self._pending.append(mac)
+        self._wakeup()
+
+
+    def _wakeup(self):
+        try:
+            self._wakeup_w.send(b'\0')
+        except (BlockingIOError, OSError):
+            pass  # Loop already has a pending wakeup
+
+
+    def _loop(self):
+
+        while True:
+
+            # Connection attempts that are due
+            now = time.time()
+            for dial in [d for d in self._dials if d[0] <= now]:
+                self._dials.remove(dial)
+                self._connect(dial[1])
+
+            # Batches whose flush window is over
+            for mac in [m for m, t in self._flushes.items() if t <= now]:
+                del self._flushes[mac]
+                if mac in self._channels:
+                    self._write(self._channels[mac])
+
+            timeout = None
+            deadlines = [d[0] for d in self._dials] + list(self._flushes.values())
+            if deadlines:
+                timeout = max(0, min(deadlines) - time.time())
+
+            for key, events in self._selector.select(timeout):
+                if key.data == 'wakeup':
+                    try:
+                        while self._wakeup_r.recv(4096):
+                            pass
+                    except BlockingIOError:
+                        pass
+                elif key.data == 'server':
+                    self._accept(key.fileobj)
+                else:
+                    channel = key.data
+                    if channel.mac is None:
+                        self._identify(channel)
+                        continue
+                    if channel.connecting:
+                        self._connected(channel)
+                        continue
+                    if events & selectors.EVENT_READ:
+                        self._read(channel)
+                    if events & selectors.EVENT_WRITE and channel.mac in self._channels:
+                        if channel.mac in self._flushes and not channel.out:
+                            # Flush window still open: the batch is written once it is over
+                            self._selector.modify(channel.sock, selectors.EVENT_READ, channel)
+                        else:
+                            self._write(channel)
+
+            # Frames sent by other threads
+            while self._pending:
+                channel = self._channels.get(self._pending.popleft())
+                if channel is None or channel.connecting:
+                    continue
+                if self._bluetooth._BATCH is None:
+                    self._write(channel)
+                elif channel.mac not in self._flushes:
+                    self._flushes[channel.mac] = time.time() + self._bluetooth._BATCH
+
+
+    def _accept(self, server):
+        try:
+            client, addr = server.accept()
+        except BlockingIOError:
+            return
+
+        client.setblocking(False)
+        mac = self._bluetooth._TRANSPORT.peer(addr)
+        if mac is None:
+            # Wait for the hello frame of the connector before opening the channel
+            self._selector.register(client, selectors.EVENT_READ, _Channel(client, None, -1))
+            return
+
+        if mac in self._channels or mac not in self._bluetooth.RPIS_MACS:
+            client.close()
+            return
+
+        self._open(_Channel(client, mac, self._bluetooth.RPIS_MACS.index(mac)))
+
+
+    def _identify(self, channel):
+        """
+        Read the hello frame of an accepted connection and open its channel
+        """
+
+        bt = self._bluetooth
+        try:
+            if channel.parser.recv_into(channel.sock) == 0:
+                raise ConnectionError
+            for flags, payload in channel.parser.frames():
+                if not (flags & FLAG_CONTROL and len(payload) == HELLO.size and payload[0] == HELLO_TYPE):
+                    raise ConnectionError
+                id = HELLO.unpack(payload)[1]
+                if not 0 <= id < len(bt.RPIS_MACS) or bt.RPIS_MACS[id] in self._channels:
+                    raise ConnectionError
+
+                self._selector.unregister(channel.sock)
+                channel.mac, channel.index = bt.RPIS_MACS[id], id
+                self._open(channel)
+                self._read_frames(channel)  # Frames received together with the hello frame
+                return
+        except (BlockingIOError, InterruptedError):
+            pass
+        except (OSError, FrameError):
+            print("Invalid hello frame, connection closed.")
+            self._selector.unregister(channel.sock)
+            channel.sock.close()
+
+
+    def _connect(self, mac):
+        if mac in self._channels:
+            return  # Already connected
+
+        print(f"Connection to {mac}...")
+        client = self._bluetooth._TRANSPORT.socket()
+        client.setblocking(False)
+        err = client.connect_ex(self._bluetooth._TRANSPORT.address(mac))
+        channel = _Channel(client, mac, self._bluetooth.RPIS_MACS.index(mac))
+
+        if err == 0:
+            self._open(channel, dialed=True)
+        elif err in (errno.EINPROGRESS, errno.EAGAIN, errno.EWOULDBLOCK):
+            channel.connecting = True
+            self._channels[mac] = channel
+            self._selector.register(client, selectors.EVENT_WRITE, channel)
+        else:
+            client.close()
+            self._retry(mac)
+
+
+    def _connected(self, channel):
+        """
+        Non-blocking connection attempt has completed, successfully or not
+        """
+
+        err = channel.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        self._selector.unregister(channel.sock)
+        del self._channels[channel.mac]
+
+        if err != 0:
+            channel.sock.close()
+            self._retry(channel.mac)
+            return
+
+        channel.connecting = False
+        self._open(channel, dialed=True)
+
+
+    def _retry(self, mac):
+        delay = self._bluetooth._next_retry(mac)
+        print(f"Impossible to connect with {mac}, new attempt in {delay:.2f}s...")
+        self._dials.append([time.time() + delay, mac])
+
+
+    def _open(self, channel, dialed=False):
+        print(f"Connected to {channel.mac}")
+        self._channels[channel.mac] = channel
+        self._selector.register(channel.sock, selectors.EVENT_READ, channel)
+        self._bluetooth._register(channel.mac, channel.sock)
+        channel.queue = self._bluetooth._outbound[channel.mac]
+
+        if dialed and not self._bluetooth._TRANSPORT.IDENTIFIES_PEER:
+            channel.out += self._bluetooth._hello()
+            self._write(channel)
+
+
+    def _close(self, channel):
+        print(f"Disconnected from {channel.mac}")
+        self._selector.unregister(channel.sock)
+        channel.sock.close()
+        self._channels.pop(channel.mac, None)
+        self._bluetooth._unregister(channel.mac, channel.sock)
+
+        # Lost connections are dialed again by the neighbor with the lower MAC address
+        if channel.mac > self._bluetooth._MAC:
+            delay = self._bluetooth._next_retry(channel.mac)
+            print(f"New connection attempt with {channel.mac} in {delay:.2f}s...")
+            self._dials.append([time.time() + delay, channel.mac])
+
+
+    def _read(self, channel):
+        try:
+            if channel.parser.recv_into(channel.sock) == 0:
+                print(f"Client {channel.mac} closed the connection.")
+                self._close(channel)
+                return
+
+            self._read_frames(channel)
+
+        except (BlockingIOError, InterruptedError):
+            pass
+        except FrameError as e:
+            print(f"Framing error with {channel.mac}: {e}")
+            self._close(channel)
+        except OSError:
+            print(f"Connection lost with {channel.mac}")
+            self._close(channel)
+
+
+    def _read_frames(self, channel):
+        for flags, payload in channel.parser.frames():
+            self._bluetooth._handle_frame(channel.index, flags, payload)
+
+
+    def _write(self, channel):
+        try:
+            # Take queued messages once the previous ones are written, the queue applies its policy meanwhile
+            if not channel.out:
+                channel.out += self._bluetooth._pack(channel.queue.get_all(), channel.index)
+
+            if channel.out:
+                n = channel.sock.send(channel.out)
+                del channel.out[:n]
+        except (BlockingIOError, InterruptedError):
+            pass
+        except OSError:
+            print(f"Sending error to {channel.mac}")
+            self._bluetooth._link_stats[channel.index].send_errors += 1
+            self._close(channel)
+            return
+
+        # Only wait for writability while there is something left to write
+        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if channel.out or channel.queue.depth() else 0)
+        if self._selector.get_key(channel.sock).events != events:
+            self._selector.modify(channel.sock, events, channel)
@@ -5,13 +5,19 @@ based on the Balboa self-balancing robot
 © 2025 Romain Englebert
 """
 
+import threading
 import time
-import struct
+import traceback
+from collections import deque
+from schema import MessageSchema, SYNC
+
+np = None  # numpy, only imported with numpy_buffer
 
 
 class Sync:
 
-    def __init__(self, bt, init_state, next_state, state_struct, delay=0, process_id=0, verbose=True):
+    def __init__(self, bt, init_state, next_state, state_struct, delay=0, process_id=0, verbose=True,
+                 single_message=False, staleness=None, timeout=None, numpy_buffer=False, profile=False, pacing=None):
         """
         Args:
             bt:                     instance of Bluetooth used for this process.
@@ -20,6 +26,16 @@ class Sync:
             state_struct:               str corresponding to the state type base on struct types (size:len(init_state))
             delay:                  optional delay between each message
             process_id:             optional int corresponding to the process id
+            single_message:         send one message per round instead of two (state then ACK), see run()
+            staleness:              optional int k: run up to k iterations ahead of the slowest neighbor, see run()
+            timeout:                optional deadline of each round in seconds (on top of the delay sleeps, the current
+                                    paced delay with pacing), the round then continues without the missing neighbors
+                                    (see run())
+            numpy_buffer:           bool for keeping the buffer in a preallocated structured ndarray (see below)
+            profile:                bool for recording the time spent in each phase of each round in self.profiler
+                                    (phases 'ack', 'send', 'state', 'compute', 'delay', see profiler.py)
+            pacing:                 optional AdaptivePacing (see pacing.py) replacing delay: the delay is then adapted
+                                    after each round from the measured round and round trip times and congestion
 
         Notes:
             process_id has to be set if several processes need bluetooth.
@@ -39,6 +55,13 @@ class Sync:
 
             However, the process number will not be included into bluetooth.buffer.
                 - Using above example: self.bluetooth.buffer will in the following structure: ['d', ..., 'd']
+
+            With numpy_buffer, self.buffer (and the buffer given to next_state) is a structured ndarray with one row per
+            RPi and the fields 'iteration', 'state' and 'ack', filled with np.frombuffer from the received messages.
+            state_struct must then have a single type (e.g. 'ffffff'), buffer['state'] being a (RPis x state) matrix:
+                - average consensus: lambda buf: buf['state'][bluetooth.neighbors_index + [bluetooth.ID]].mean(axis=0)
+                - weighted mixing: lambda buf: W[bluetooth.ID] @ buf['state']
+            Rows can still be read as [iteration, state, ACK] (buf[n][0] is the iteration of RPi n).
         """
 
         if len(state_struct) != len(init_state):
@@ -49,14 +72,63 @@ class Sync:
         self.state = init_state  # Initial value of current RPi
         self.data = [[time.time(), *init_state]]  # For data saving
         self.more_data = [-1]  # For saving more than only the state (not used when self.more_data[0] == -1)
-        temp = [-1.0]*len(init_state)
-        self.buffer = [[-1, *temp, 0] for _ in range(len(bt.RPIS_MACS))]  # Neighbors messages [iteration, state, ACK]
+        self.NUMPY = numpy_buffer
+        if numpy_buffer:
+            global np
+            import numpy as np
+            if len(set(state_struct)) != 1:
+                print("numpy_buffer requires a state_struct with a single type (e.g. 'fff')")
+                raise Exception
+            state_type = np.dtype('<' + state_struct[0])
+            self._wire_type = np.dtype([('iteration', '<u4'), ('state', state_type, (len(init_state),)), ('ack', '<u4')])
+            self.buffer = np.zeros(len(bt.RPIS_MACS), dtype=[('iteration', '<i8'), ('state', state_type, (len(init_state),)),
+                                                             ('ack', '<i8')])
+            self.buffer['iteration'] = -1
+            self.buffer['state'] = -1
+        else:
+            temp = [-1.0]*len(init_state)
+            self.buffer = [[-1, *temp, 0] for _ in range(len(bt.RPIS_MACS))]  # Neighbors messages [iteration, state, ACK]
         self.next_state = next_state
+        self.iteration = 0  # Current iteration
+        self._last_message = None  # Last sent message, sent again to neighbors that reconnect
+        self._round = threading.Condition()  # Notified when the current round is complete (messages decoded on arrival)
+        self._missing = set()  # Neighbors whose message of the current round has not been received yet
+        self._unacked = set()  # Neighbors that have not acknowledged the previous round yet
+        self._round_times = deque(maxlen=100)  # End time of the last rounds, for rounds_per_second()
+        self._next = {}  # index: message of the next round received before the end of the current one (single_message)
+        self.active = list(bt.neighbors_index)  # Neighbors whose state has been used by the last round
+        self.missing = set()  # Neighbors that missed the deadline of the last round
+        self._excluded = set()  # Disconnected neighbors, not waited for with timeout
+        self.stragglers = []  # [iteration, [missing neighbors]] each time the missing neighbors change
+        self.error = None  # Exception that stopped run(), if any
 
         self.PROCESS = process_id
         self.DELAY = delay
-        self.TYPE = f'<H{state_struct}H'  # First and last 'H' are respectively used for iteration and acknowledgement synchronization loop
+        self.TYPE = f'<I{state_struct}I'  # First and last 'I' are respectively used for iteration and acknowledgement synchronization loop
+        self.SCHEMA = MessageSchema(SYNC, self.TYPE[1:])  # Compiled once, type id SYNC on the wire
         self.VERBOSE = verbose
+        self.SINGLE_MESSAGE = single_message
+        self.STALENESS = staleness
+        self._ACK = not single_message and staleness is None  # ACK messages of the lockstep protocol
+        self.TIMEOUT = timeout
+
+        self.profiler = None
+        if profile:
+            from profiler import RoundProfiler  # numpy is only needed when profiling
+            self.profiler = RoundProfiler(['ack', 'send', 'state', 'compute', 'delay'])
+        self._traffic = bt.process_stats(process_id)  # Bytes sent and received by this process, for the profiler
+        self.pacing = pacing
+        self._dropped = 0  # Frames dropped by the outbound queues, for the pacing
+
+        bt.subscribe_links(self._on_link)
+        bt.subscribe(process_id, self._on_message)
+
+        # Messages received before this instance subscribed (e.g. neighbors that started first)
+        with self._round:
+            for n in bt.neighbors_index:
+                message, _ = bt.last_message(process_id, n)
+                if message != -1:
+                    self._on_message(n, message)
 
 
     def get_buffer(self):
@@ -70,10 +142,157 @@ class Sync:
         """
 
         for i in range(len(self.buffer)):
-            if self.bluetooth.buffer[self.PROCESS][i] != -1:
-                temp = list(struct.unpack(self.TYPE, self.bluetooth.buffer[self.PROCESS][i]))
-                self.buffer[i][:] = temp
-        self.buffer[self.bluetooth.ID][1:-1] = self.state
+            message = self.bluetooth.buffer[self.PROCESS][i]
+            if message != -1 and self.SCHEMA.matches(message):
+                self._set_row(i, self._decode(message))
+        self._set_own_state()
+
+
+    def _decode(self, message):
+        """
+        Return [iteration, state, ACK] of a received message (a record of the ndarray type with numpy_buffer)
+        """
+
+        if self.NUMPY:
+            return np.frombuffer(message, dtype=self._wire_type, count=1, offset=1)[0]  # After the type id
+        return self.SCHEMA.unpack(message)
+
+
+    def _set_row(self, index, values):
+        if self.NUMPY:
+            self.buffer[index] = values
+        else:
+            self.buffer[index][:] = values
+
+
+    def _set_own_state(self):
+        if self.NUMPY:
+            self.buffer['state'][self.bluetooth.ID] = self.state
+        else:
+            self.buffer[self.bluetooth.ID][1:-1] = self.state
+
+
+    def _send(self, message):
+        self._last_message = message
+        self.bluetooth.send_bytes(message)
+
+
+    def _on_link(self, index, up):
+        """
+        The last message may have been lost with the connection: it is sent again when the neighbor reconnects
+        """
+
+        if up and self._last_message is not None:
+            self.bluetooth.send_bytes(self._last_message, dest=[index])
+
+        # With timeout, a disconnected neighbor is not waited for until it reconnects
+        if self.TIMEOUT is not None and index in self.bluetooth.neighbors_index:
+            with self._round:
+                if up:
+                    self._excluded.discard(index)
+                else:
+                    self._excluded.add(index)
+                    self._missing.discard(index)
+                    self._unacked.discard(index)
+                    self._round.notify_all()
+
+
+    def _on_message(self, index, message):
+        """
+        Decode each message as soon as it is received (run by the receiving thread) and update the current round
+        """
+
+        if not self.SCHEMA.matches(message):
+            return
+        values = self._decode(message)
+
+        with self._round:
+            if self.SINGLE_MESSAGE and self.STALENESS is None and values[0] == self.iteration + 1:
+                self._next[index] = values  # Kept until the current round is over
+                return
+
+            self._set_row(index, values)
+            if self._arrived(values[0]):
+                self._missing.discard(index)
+            if values[-1] == self.iteration:
+                self._unacked.discard(index)
+            if not self._missing or not self._unacked:
+                self._round.notify_all()
+
+
+    def _start_round(self, iteration):
+        """
+        Set the current iteration and the neighbors it waits for, from the messages already received
+        Returns the iteration, that is fast-forwarded when neighbors went on without this RPi (timeout).
+        """
+
+        with self._round:
+            # Round of each neighbor: its ACK field is its iteration, or the next one once it has completed it
+            ahead = max([self.buffer[n][-1] for n in self.bluetooth.neighbors_index], default=-1)
+            if self.TIMEOUT is not None and self.STALENESS is None and ahead > iteration:
+                print(f"Neighbors are at iteration {ahead}, fast-forward from iteration {iteration}")
+                iteration = ahead
+
+            self.iteration = iteration
+            for index, values in self._next.items():
+                self._set_row(index, values)
+            self._next = {}
+
+            neighbors = self.bluetooth.neighbors_index
+            self._missing = {n for n in neighbors if not self._arrived(self.buffer[n][0]) and n not in self._excluded}
+            self._unacked = set()
+            if iteration > 0 and self._ACK:
+                self._unacked = {n for n in neighbors if self.buffer[n][-1] != iteration and n not in self._excluded}
+
+        return iteration
+
+
+    def _end_round(self):
+        """
+        Update the active and missing neighbors of the current round and return a copy of its buffer
+        The rows of missing neighbors are replaced by the row of this RPi: their weight in the mix goes to this RPi.
+        """
+
+        neighbors = self.bluetooth.neighbors_index
+        self._set_own_state()
+        buffer = self.buffer.copy() if self.NUMPY else [row[:] for row in self.buffer]
+
+        missing = {n for n in neighbors if not self._arrived(self.buffer[n][0])}
+        for n in missing:
+            buffer[n] = buffer[self.bluetooth.ID] if self.NUMPY else buffer[self.bluetooth.ID][:]
+        self.active = [n for n in neighbors if n not in missing]
+
+        if missing != self.missing:
+            self.stragglers.append([self.iteration, sorted(missing)])
+            if missing:
+                print(f"Iteration {self.iteration}: no message from {sorted(missing)}, continued without them")
+            else:
+                print(f"Iteration {self.iteration}: every neighbor is back")
+        self.missing = missing
+        return buffer
+
+
+    def mixing_weights(self):
+        """
+        Return {index: weight} of uniform weights over this RPi and the active neighbors of the last round
+        """
+
+        weight = 1 / (len(self.active) + 1)
+        return {n: weight for n in self.active + [self.bluetooth.ID]}
+
+
+    def _remaining(self, deadline):
+        return None if deadline is None else max(0.0, deadline - time.time())
+
+
+    def _arrived(self, iteration):
+        """
+        Return True if a neighbor state of iteration can be used for the current round
+        """
+
+        if self.STALENESS is None:
+            return iteration == self.iteration
+        return iteration >= max(0, self.iteration - self.STALENESS)
 
 
     def get_ACK(self, iteration):
@@ -87,10 +306,59 @@ class Sync:
 
         if iteration == 0:
             return False
-        try:
-            return any([struct.unpack(self.TYPE, self.bluetooth.buffer[self.PROCESS][n])[-1] != iteration for n in self.bluetooth.neighbors_index])
-        except:
-            return True
+        return any([self.buffer[n][-1] != iteration for n in self.bluetooth.neighbors_index])
+
+
+    def _delay(self):
+        return self.DELAY if self.pacing is None else self.pacing.delay
+
+
+    def _sleep(self):
+        time.sleep(self._delay())
+
+
+    def _pace(self, round_time):
+        """
+        Report the last round to self.pacing: congested if a frame has been dropped or an outbound queue is building up
+
+        Neighbors missing the deadline are not a sign of congestion: neighbors pace independently, and one sleeping
+        longer than this RPi (or starting late) would make the delays of the swarm grow in turn.
+        """
+
+        queues = self.bluetooth.queue_stats()
+        dropped = sum(queue['dropped'] for queue in queues.values())
+        congested = dropped > self._dropped or any(queue['depth'] > self.pacing.QUEUE_LIMIT for queue in queues.values())
+        self._dropped = dropped
+
+        rtts = [self.bluetooth.link_stats(n).rtt for n in self.bluetooth.neighbors_index]
+        rtt = max([rtt for rtt in rtts if rtt is not None], default=None)
+        self.pacing.update(round_time, rtt, congested)
+
+
+    def _mark(self, phase):
+        if self.profiler is not None:
+            self.profiler.mark(phase)
+
+
+    def _save(self, t, flag):
+        """
+        Append the current state to self.data (flag: 1 when it is sent, 0 when it has just been computed)
+        """
+
+        self.data.append([t, *self.state, flag])
+        if self.more_data[0] != -1:
+            for j in range(len(self.more_data)):
+                self.data[-1].append(self.more_data[j])
+
+
+    def rounds_per_second(self):
+        """
+        Return the number of rounds per second over the last rounds (up to 100), 0 before 2 rounds
+        """
+
+        if len(self._round_times) < 2:
+            return 0.0
+        return (len(self._round_times) - 1) / (self._round_times[-1] - self._round_times[0])
 
 
     def run(self):
@@ -99,71 +367,107 @@ class Sync:
 
             0. Wait for ACK from each neighbors before going to 1.
             1. It sends its iteration and value to all neighbors
-            2. It fills the communication buffer with iteration and values sent by neighbors
-            3. Go back to (2) while current iteration message has not been sent by all neighbors
-            4. Compute new iteration's state
-            5. Loop back to (1)
+            2. Wait until the current iteration message has been received from all neighbors
+            3. Compute new iteration's state
+            4. Loop back to (1)
 
         Notes:
-            - self.bluetooth.buffer is filled with hex messages as soon as it is received
-            - self.buffer is filled with [iteration, state, ACK] from self.bluetooth.buffer as soon as we call self.get_buffer
-            - There are 2 synchronization loop:
-                - First: acknowledgement loop used to avoid skipping iterations
-                - Second: iteration loop used to wait for reception of all states from the current iteration.
+            - Each message is decoded into self.buffer ([iteration, state, ACK]) as soon as it is received, which
+              wakes up the round when it was the last one missing: a round lasts as long as the network needs.
+            - There are 2 synchronization steps:
+                - First: acknowledgement used to avoid skipping iterations
+                - Second: iteration used to wait for reception of all states from the current iteration.
+
+        With single_message, the ACK of round i is piggybacked on the state of round i+1: a neighbor only sends it once
+        it has received every state of round i, so receiving it is an implicit acknowledgement. Step 0 and the ACK
+        message are skipped. A neighbor is then at most one round ahead: its next state is kept apart (self._next)
+        until the current round is over, so that no iteration is skipped. This relies on the ordered and lossless
+        delivery of Bluetooth (at most one message per round is queued for each neighbor).
+
+        With staleness=k, rounds are not in lockstep anymore: round i only waits for each neighbor to have sent a
+        state of iteration i-k or later, and next_state uses the latest state of each neighbor. Its row in the buffer
+        starts with the iteration of this state, so that stale values can be weighted. No ACK is sent: the slowest
+        neighbor sets the pace only when a node is k iterations ahead of it.
+
+        With timeout, each round has a deadline: once it is over, the round goes on with the neighbors that answered.
+        The others are reported (printed and self.stragglers), their rows are replaced by the row of this RPi in the
+        buffer given to next_state (self.active and mixing_weights() give the neighbors actually used). They are still
+        waited for until the deadline of each round (not at all while their connection is lost), and re-admitted as soon
+        as their message of the current round arrives.
+        A RPi whose neighbors went on without it (e.g. after a reboot) fast-forwards to their iteration.
+
+        An exception stops the process: it is reported (printed and self.error) and raised again.
         """
 
+        try:
+            self._run()
+        except Exception as e:
+            self.error = e
+            print(f"Sync process {self.PROCESS} stopped at iteration {self.iteration}: {e!r}")
+            traceback.print_exc()
+            raise
+
+
+    def _run(self):
+
         i = 0  # iteration value
         while True:
 
-            # First synchronization loop
-            # While not ack i-1
-            while self.get_ACK(i):
-                time.sleep(1e-1)
-                """if self.VERBOSE:
-                    print("Wait for ACK")"""
-
-            self.data.append([time.time(), *self.state, 1])
-            if self.more_data[0] != -1:
-                for j in range(len(self.more_data)):
-                    self.data[-1].append(self.more_data[j])
-
-            # Messages has the structure : [PROCESS_ID, iteration, state, ACK] ([ushort, ushort, self.TYPE, ushort])
-            self.bluetooth.send_message(f'<B{self.TYPE[1:]}', self.PROCESS, i, *self.state, i)  # Send state to neighbors
-
-            # Wait to receive initial neighbor's state
-            while any([self.bluetooth.buffer[self.PROCESS][n] == -1 for n in self.bluetooth.neighbors_index]):
-                time.sleep(1e-1)
-                """if self.VERBOSE:
-                    print("Wait for init message")"""
-
-            self.get_buffer()  # Update neighbor's state knowledge
-
-            # Second synchronization loop
-            # Wait for the message of the current iteration from all neighbors
-            while any([self.buffer[n][0] != i for n in self.bluetooth.neighbors_index]):
-                time.sleep(1e-1)
-                """if self.VERBOSE:
-                    print("Wait for all neighbors states")"""
-                self.get_buffer()  # Update neighbor's state knowledge
+            if self.profiler is not None:
+                self.profiler.start()
+                traffic = self._traffic.bytes_out, self._traffic.bytes_in
+
+            i = self._start_round(i)
+            start = time.time()
+            deadline = None if self.TIMEOUT is None else start + self.TIMEOUT + 2 * self._delay()  # Neighbors sleep too
+
+            # First synchronization step
+            # Wait for ack i-1, woken up by the message that completes it
+            with self._round:
+                self._round.wait_for(lambda: not self._unacked, self._remaining(deadline))
+            self._mark('ack')
+
+            self._save(time.time(), 1)
+
+            # Messages has the structure : [PROCESS_ID, SYNC, iteration, state, ACK] ([uchar, uchar, uint, state_struct, uint])
+            self._send(self.SCHEMA.pack(self.PROCESS, i, *self.state, i))  # Send state to neighbors
+            self._mark('send')
+
+            # Second synchronization step
+            # Wait for the message of the current iteration from all neighbors, then copy the states of this round
+            # (neighbors may send their next iteration as soon as they receive the acknowledgement)
+            with self._round:
+                self._round.wait_for(lambda: not self._missing, self._remaining(deadline))
+                buffer = self._end_round()
+            self._round_times.append(time.time())
+            self._mark('state')
+
+            if self.pacing is not None:
+                self._pace(self._round_times[-1] - start)
 
             # If the RPi lost connection with timeoutafter few iterations, increase this delay
-            time.sleep(self.DELAY)
+            self._sleep()
+            self._mark('delay')
 
-            # Send acknowledgement
+            # Send acknowledgement (piggybacked on the next state with single_message)
             t = time.time()
-            self.bluetooth.send_message(f'<B{self.TYPE[1:]}', self.PROCESS, i, *self.state, i+1)
+            if self._ACK:
+                self._send(self.SCHEMA.pack(self.PROCESS, i, *self.state, i+1))
+            self._mark('send')
 
             # Compute the current state
-            self.state = self.next_state(self.buffer)
+            self.state = self.next_state(buffer)
 
             # For data saving
-            self.data.append([t, *self.state, 0])
-            if self.more_data[0] != -1:
-                for j in range(len(self.more_data)):
-                    self.data[-1].append(self.more_data[j])
+            self._save(t, 0)
+            self._mark('compute')
 
             # Optional delay in order to observe convergence
-            time.sleep(self.DELAY)
+            self._sleep()
+            self._mark('delay')
+
+            if self.profiler is not None:
+                self.profiler.end(self._traffic.bytes_out - traffic[0], self._traffic.bytes_in - traffic[1])
 
             # Print state
             if self.VERBOSE:
@@ -172,3 +476,99 @@ class Sync:
                 print()
 
             i += 1
+
+
+class SyncMember:
+    """
+    One state vector advanced by a SyncGroup, used like a Sync instance (state, data)
+    """
+
+    def __init__(self, init_state, next_state, state_struct):
+        """
+        Same arguments as Sync: next_state(buffer) receives rows [iteration, state of this member, ACK]
+        """
+
+        if len(state_struct) != len(init_state):
+            print("The specified data type must be the same length of initial state")
+            raise Exception
+
+        self.state = init_state
+        self.next_state = next_state
+        self.data = [[time.time(), *init_state]]  # For data saving
+
+        self.STRUCT = state_struct
+
+
+class SyncGroup(Sync):
+    """
+    Advance several state vectors in the same synchronous rounds
+
+    The states of the members are packed into one message, so that there is one ACK handshake and one message
+    (or two) per round for all of them, instead of one Sync per state vector each with its own process.
+    Each member keeps its own next_state, state and data. For example, in synchro.py:
+        phase_consensus = SyncMember([phase], compute_average, 'f')
+        freq_consensus = SyncMember([init_freq], compute_average, 'f')
+        group = SyncGroup(bluetooth, [phase_consensus, freq_consensus], delay=0.5)
+        threading.Thread(target=group.run, daemon=True).start()
+    """
+
+    def __init__(self, bt, members, **kwargs):
+        """
+        members: list of SyncMember
+        kwargs: other arguments of Sync (delay, process_id, single_message, ...)
+        """
+
+        self.members = members
+        self._slices = []  # Position of the state of each member in the message
+        start = 0
+        for member in members:
+            self._slices.append(slice(start, start + len(member.state)))
+            start += len(member.state)
+
+        super().__init__(bt, self.state, self._next_states, ''.join(m.STRUCT for m in members), **kwargs)
+
+
+    @property
+    def state(self):
+        """
+        Concatenation of the states of the members (they can be modified by other threads between rounds)
+        """
+
+        return [value for member in self.members for value in member.state]
+
+
+    @state.setter
+    def state(self, state):
+        for member, part in zip(self.members, self._slices):
+            member.state = list(state[part])
+
+
+    def _next_states(self, buffer):
+        state = []
+        for member, part in zip(self.members, self._slices):
+            state += list(member.next_state(self._member_buffer(buffer, part)))
+        return state
+
+
+    def _member_buffer(self, buffer, part):
+        """
+        Return the buffer of one member: rows [iteration, state[part], ACK] (same ndarray fields with numpy_buffer)
+        """
+
+        if not self.NUMPY:
+            return [[row[0], *row[1:-1][part], row[-1]] for row in buffer]
+
+        size = part.stop - part.start
+        member = np.zeros(len(buffer), dtype=[('iteration', buffer.dtype['iteration']),
+                                              ('state', buffer.dtype['state'].base, (size,)),
+                                              ('ack', buffer.dtype['ack'])])
+        member['iteration'] = buffer['iteration']
+        member['state'] = buffer['state'][:, part]
+        member['ack'] = buffer['ack']
+        return member
+
+
+    def _save(self, t, flag):
+        super()._save(t, flag)
+        for member in self.members:
+            member.data.append([t, *member.state, flag])
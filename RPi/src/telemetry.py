@@ -0,0 +1,146 @@
+"""
+* Master's Thesis *
+Implementation of a robotic swarm platform
+based on the Balboa self-balancing robot
+© 2025 Romain Englebert
+"""
+
+
+import bisect
+import csv
+import json
+import os
+import threading
+import time
+
+
+# Upper bounds (s) of the inter-arrival histogram buckets, the last bucket is everything above
+HISTOGRAM_EDGES = [1e-3, 2e-3, 5e-3, 1e-2, 2e-2, 5e-2, 1e-1, 2e-1, 5e-1, 1.0, 2.0, 5.0]
+
+SMOOTHING = 0.1  # Weight of a new sample in latency averages
+
+CSV_HEADER = ['time', 'neighbor', 'frames_in', 'bytes_in', 'frames_out', 'bytes_out', 'send_errors', 'dropped',
+              'queue_depth', 'one_way', 'rtt']
+
+
+def _smooth(average, sample):
+    return sample if average is None else average + SMOOTHING * (sample - average)
+
+
+class LinkStats:
+    """
+    Counters of the frames exchanged with one neighbor, updated by Bluetooth (a few operations per frame)
+    """
+
+    def __init__(self):
+        self.frames_in = 0
+        self.bytes_in = 0
+        self.frames_out = 0
+        self.bytes_out = 0
+        self.send_errors = 0
+        self.inter_arrival = [0] * (len(HISTOGRAM_EDGES) + 1)
+        self.one_way = None  # Average of reception time - embedded send time of timestamped frames (includes clock offset)
+        self.rtt = None  # Average round trip time measured with heartbeats (no clock offset)
+
+        self._last_arrival = None
+
+
+    def received(self, size, now):
+        self.frames_in += 1
+        self.bytes_in += size
+        if self._last_arrival is not None:
+            self.inter_arrival[bisect.bisect_left(HISTOGRAM_EDGES, now - self._last_arrival)] += 1
+        self._last_arrival = now
+
+
+    def sent(self, frames, size):
+        self.frames_out += frames
+        self.bytes_out += size
+
+
+    def latency(self, one_way):
+        self.one_way = _smooth(self.one_way, one_way)
+
+
+    def round_trip(self, rtt):
+        self.rtt = _smooth(self.rtt, rtt)
+
+
+    def snapshot(self):
+        return {'frames_in': self.frames_in, 'bytes_in': self.bytes_in,
+                'frames_out': self.frames_out, 'bytes_out': self.bytes_out,
+                'send_errors': self.send_errors, 'inter_arrival': list(self.inter_arrival),
+                'one_way': self.one_way, 'rtt': self.rtt}
+
+
+class ProcessStats:
+    """
+    Counters of the messages of one process
+    """
+
+    def __init__(self):
+        self.messages_in = 0
+        self.bytes_in = 0
+        self.messages_out = 0
+        self.bytes_out = 0
+        self.dropped = 0  # Messages dropped by the outbound queues (send_policy) or sent to disconnected neighbors
+
+
+    def received(self, size):
+        self.messages_in += 1
+        self.bytes_in += size
+
+
+    def sent(self, size, receivers):
+        self.messages_out += receivers
+        self.bytes_out += size * receivers
+
+
+    def snapshot(self):
+        return {'messages_in': self.messages_in, 'bytes_in': self.bytes_in,
+                'messages_out': self.messages_out, 'bytes_out': self.bytes_out, 'dropped': self.dropped}
+
+
+class StatsDump:
+    """
+    Thread appending bluetooth.stats() to a file each period seconds
+
+    file_path ending with '.csv': one row per neighbor and period (see CSV_HEADER)
+    otherwise: one JSON snapshot per line
+    """
+
+    def __init__(self, bt, file_path, period=1.0):
+        self._bluetooth = bt
+        self._FILE_PATH = file_path
+        self._PERIOD = period
+        self._running = True
+
+        if file_path.endswith('.csv') and not os.path.exists(file_path):
+            with open(file_path, mode='w', newline='', encoding='utf-8') as file:
+                csv.writer(file).writerow(CSV_HEADER)
+
+        threading.Thread(target=self._loop, daemon=True).start()
+
+
+    def stop(self):
+        self._running = False
+
+
+    def _loop(self):
+        while self._running:
+            time.sleep(self._PERIOD)
+            self.write(self._bluetooth.stats())
+
+
+    def write(self, stats):
+        with open(self._FILE_PATH, mode='a', newline='', encoding='utf-8') as file:
+            if not self._FILE_PATH.endswith('.csv'):
+                file.write(json.dumps(stats) + '\n')
+                return
+
+            writer = csv.writer(file)
+            for neighbor, link in stats['links'].items():
+                queue = stats['queues'].get(neighbor, {})
+                writer.writerow([stats['time'], neighbor, link['frames_in'], link['bytes_in'],
+                                 link['frames_out'], link['bytes_out'], link['send_errors'],
+                                 queue.get('dropped', 0), queue.get('depth', 0), link['one_way'], link['rtt']])
@@ -0,0 +1,124 @@
+"""
+* Master's Thesis *
+Implementation of a robotic swarm platform
+based on the Balboa self-balancing robot
+© 2025 Romain Englebert
+"""
+
+
+import os
+import socket
+
+
+class RFCOMMTransport:
+    """
+    Bluetooth RFCOMM sockets, addresses are MAC addresses (default transport of Bluetooth)
+    """
+
+    IDENTIFIES_PEER = True  # accept() returns the MAC address of the peer
+    MAX_NEIGHBORS = 7  # Bluetooth piconet limitation
+
+    def __init__(self, port=1):
+        self._PORT = port
+
+
+    def socket(self):
+        return socket.socket(socket.AF_BLUETOOTH, socket.SOCK_STREAM, socket.BTPROTO_RFCOMM)
+
+
+    def address(self, addr):
+        return addr, self._PORT
+
+
+    def listen(self, addr, backlog=5):
+        server = self.socket()
+        server.bind(self.address(addr))
+        server.listen(backlog)
+        return server
+
+
+    def peer(self, addr):
+        """
+        Return the address of the peer from the address given by accept()
+        """
+        return addr[0]
+
+
+class TCPTransport:
+    """
+    TCP sockets, addresses are 'host:port' strings (e.g. '127.0.0.1:47000')
+
+    Peers cannot be identified by their source port: the connector sends a hello frame with its ID first.
+    """
+
+    IDENTIFIES_PEER = False
+    MAX_NEIGHBORS = None
+
+    def socket(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+
+
+    def address(self, addr):
+        host, port = addr.rsplit(':', 1)
+        return host, int(port)
+
+
+    def listen(self, addr, backlog=64):
+        server = self.socket()
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind(self.address(addr))
+        server.listen(backlog)
+        return server
+
+
+    def peer(self, addr):
+        return None
+
+
+class UnixTransport:
+    """
+    AF_UNIX stream sockets, addresses are file system paths
+
+    As for TCP, the connector identifies itself with a hello frame.
+    """
+
+    IDENTIFIES_PEER = False
+    MAX_NEIGHBORS = None
+
+    def socket(self):
+        return socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+
+    def address(self, addr):
+        return addr
+
+
+    def listen(self, addr, backlog=64):
+        if os.path.exists(addr):
+            os.unlink(addr)  # Left by a previous run
+        server = self.socket()
+        server.bind(addr)
+        server.listen(backlog)
+        return server
+
+
+    def peer(self, addr):
+        return None
+
+
+def tcp_addresses(n, host='127.0.0.1', base_port=47000):
+    """
+    Return n addresses for TCPTransport, to be used instead of RPIS_MACS
+    """
+    return [f"{host}:{base_port + i}" for i in range(n)]
+
+
+def unix_addresses(n, directory='/tmp/balboa'):
+    """
+    Return n addresses for UnixTransport, to be used instead of RPIS_MACS
+    The names are zero-padded so that their order (used to choose who connects to who) matches the IDs.
+    """
+    os.makedirs(directory, exist_ok=True)
+    return [os.path.join(directory, f"node_{i:04d}.sock") for i in range(n)]
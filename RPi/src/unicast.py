@@ -7,24 +7,34 @@ based on the Balboa self-balancing robot
 
 import time
 import threading
-import struct
 from collections import deque, namedtuple
-from copy import deepcopy
+from schema import MessageSchema, UNICAST, register, decode
 
 
 UnicastMessage = namedtuple('UnicastMessage', ['id', 'sender', 'receiver', 'ACK', 'index', 'size', 'data', 'path'])
 
+LISTEN_TIMEOUT = 0.5  # Period (s) at which the listening thread checks that it has to go on
+
+# Wire format: [id (ushort), sender, receiver (uchar), ACK (bool), index (uchar), size (ushort)],
+# then tail: [data (size bytes), path (uchar each)]
+UNICAST_SCHEMA = register(MessageSchema(
+    UNICAST, 'HBB?BH',
+    encode_tail=lambda data, path: data + bytes(path),
+    decode_tail=lambda fixed, view: (bytes(view[:fixed[5]]), tuple(view[fixed[5]:]))
+))
+
 
 class Unicast:
     def __init__(self, bt, rocky, process_id=0, verbose=True, delay=0):
 
         # Public
         self.buffer = [UnicastMessage(0, -1, -1, False, 0, 0, b"", []) for _ in range(len(bt.RPIS_MACS))]
-        self.buffer = [UnicastMessage(0, -1, -1, False, 0, 0, b"", []) for _ in range(len(bt.RPIS_MACS))]
         self.last_message = None
+        self.sequence = 0  # Local sequence number of the last received message (see bluetooth.receive)
         self.ready = True
         self.data = []
         self.message_id = 0
+        self.dropped = 0  # Messages of this process dropped by Bluetooth (outbound queues, disconnected neighbors)
 
         # Private
         self._bluetooth = bt
@@ -56,20 +66,37 @@ class Unicast:
         return []
 
 
-    def _get_buffer(self):
+    def _receive(self):
+        """
+        Return the next unicast message received, None if there is none within LISTEN_TIMEOUT seconds
+
+        Each received message is handed once, in order of arrival (see bluetooth.receive), without polling.
+        """
+
+        received = self._bluetooth.receive(self._PROCESS, LISTEN_TIMEOUT)
+        if received is None:
+            return None
+
+        sequence, index, payload = received
+        if self._VERBOSE and sequence != self.sequence + 1:
+            print(f"[{self._ID}] {sequence - self.sequence - 1} messages dropped by the receive queue")
+        self.sequence = sequence
+
+        schema, values = decode(payload)
+        if schema is not UNICAST_SCHEMA:
+            return None
+
+        self.buffer[index] = UnicastMessage(*values)
+        self.last_message = self.buffer[index]
+        return self.last_message
+
 
-        for i in range(len(self.buffer)):
-            if self._bluetooth.buffer[self._PROCESS][i] != -1:
-                packed = self._bluetooth.buffer[self._PROCESS][i]
-                id = struct.unpack('H', packed[:2])[0]
-                sender = struct.unpack('B', packed[2:3])[0]
-                receiver = struct.unpack('B', packed[3:4])[0]
-                ack = struct.unpack('?', packed[4:5])[0]
-                index = struct.unpack('B', packed[5:6])[0]
-                size = struct.unpack('H', packed[6:8])[0]
-                data = struct.unpack(f'{size}s', packed[8:8 + size])[0]
-                path = struct.unpack(f'{len(packed[8+size:])}B', packed[8+size:])
-                self.buffer[i] = UnicastMessage(id, sender, receiver, ack, index, size, data, path)
+    def _leds(self, red, yellow, green):
+        """
+        Set the leds of the Balboa, if any (rocky is None for virtual nodes, see launcher.py)
+        """
+        if self._rocky is not None:
+            self._rocky.leds(red, yellow, green)
 
 
     def listen(self, mode=True):
@@ -100,7 +127,7 @@ class Unicast:
         )
         self.message_id += int(not ack)
         self._forward(message)
-        self._rocky.leds(0, int(not ack), int(ack))  # Yellow
+        self._leds(0, int(not ack), int(ack))  # Yellow
         self.data.append([time.time(), ack])
 
         print(f"[{self._ID}] Initiating unicast: {message}")
@@ -110,21 +137,15 @@ class Unicast:
 
         while self._listening:
 
-            message = None
-            while message is None:
-                last_buffer = deepcopy(self.buffer)
-                self._get_buffer()
-                for i in range(len(self.buffer)):
-                    if last_buffer[i] != self.buffer[i]:
-                        message = self.buffer[i]
-                        self.last_message = message
-                        break
+            message = self._receive()
+            if message is None:
+                continue
 
             if self._ID == message.receiver:
 
                 if self._VERBOSE:
                     print(f"Received unicast from {message.sender}: {message.data.decode('utf-8')} at {time.time()}")
-                self._rocky.leds(0, 0, 1)  # Green on receive
+                self._leds(0, 0, 1)  # Green on receive
                 self.ready = True
 
                 # Send ACK back to sender
@@ -142,9 +163,9 @@ class Unicast:
 
                 if not message.ACK:
                     self.ready = False
-                    self._rocky.leds(0, 1, 0)  # Yellow on forward
+                    self._leds(0, 1, 0)  # Yellow on forward
                 elif not self.ready:
-                    self._rocky.leds(0, 0, 1)  # Green on ACK
+                    self._leds(0, 0, 1)  # Green on ACK
                     self.ready = True
 
             self.data.append([time.time(), self.ready])
@@ -152,29 +173,56 @@ class Unicast:
             time.sleep(self._DELAY)
 
 
+    def _check_drops(self):
+        """
+        Report the messages of this process dropped since the last check (outbound queues or disconnected neighbors)
+        """
+
+        dropped = self._bluetooth.process_stats(self._PROCESS).dropped
+        if dropped > self.dropped:
+            print(f"[{self._ID}] {dropped - self.dropped} messages dropped (outbound queues, see send_policy, or lost links)")
+            self.dropped = dropped
+
+
+    def _send(self, payload, dest):
+        """
+        Send payload to dest (list of neighbors IDs, every neighbor if None)
+
+        A neighbor disconnected meanwhile (links come and go, see retry_min) counts as a drop of the process instead of
+        stopping the listening thread.
+        """
+
+        if dest is not None:
+            connected = [n for n in dest if self._bluetooth.connected(n)]
+            self._bluetooth.process_stats(self._PROCESS).dropped += len(dest) - len(connected)
+            dest = connected
+        if dest is None or dest:
+            try:
+                self._bluetooth.send_bytes(payload, dest)
+            except TypeError:  # Disconnected between the check and the send
+                self._bluetooth.process_stats(self._PROCESS).dropped += len(dest)
+        self._check_drops()
+
+
     def _forward(self, msg: UnicastMessage):
         if msg.index >= len(msg.path) - 1:
             return
 
         next_hop = msg.path[msg.index + 1]
-        path_len = len(msg.path)
-
-        msg_type = f'<BHBB?BH{msg.size}s{path_len}B'
-
-        self._bluetooth.send_message(
-            msg_type,
-            self._PROCESS,
-            msg.id,
-            msg.sender,
-            msg.receiver,
-            msg.ACK,
-            msg.index,
-            msg.size,
-            msg.data,
-            *msg.path,
-            dest=[next_hop]
+
+        self._send(
+            UNICAST_SCHEMA.pack(
+                self._PROCESS,
+                msg.id,
+                msg.sender,
+                msg.receiver,
+                msg.ACK,
+                msg.index,
+                msg.size,
+                msg.data,
+                msg.path
+            ),
+            [next_hop]
         )
         if self._VERBOSE:
             print(f"Sent unicast from {self._ID} to {next_hop} (next index: {msg.index + 1})")
-
-        time.sleep(0.05)